@@ -32,6 +32,27 @@ class Config:
 
         self.mutation_ratio = 0.05
 
+        # 'objects' keeps every animal as an Animal instance, 'arrays' stores them in NumPy columns,
+        # 'parallel' splits the map into strips of rows stepped by worker processes,
+        # 'sparse' keeps animal counts only where animals are, for huge mostly empty maps
+        self.engine = 'objects'
+        # worker processes of the 'parallel' engine, None starts one per CPU core
+        self.n_workers = None
+
+        # seed of the simulation's random number generator, None draws a fresh one every run
+        self.seed = None
+
+        # frames per second of the GUI when it is decoupled from the simulation: turns run on their own thread
+        # and the window redraws the latest one at this rate; None redraws every turn from the simulation thread
+        self.render_fps = None
+
+        # file the GUI streams one binary record per turn to, see world.recorder; None records nothing.
+        # Every new simulation starts the file over
+        self.record_file = None
+        # file the GUI records the map of every `frames_every`-th turn to for replaying, see world.recorder
+        self.frames_file = None
+        self.frames_every = 1
+
     def save(self, file_name='config.json'):
         with open(file_name, 'w') as file:
             file.write(json.dumps(self, default=lambda o: o.__dict__))
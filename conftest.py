@@ -0,0 +1 @@
+# makes pytest put the repository root on sys.path, so that tests import `world`, `runner` and `config` as the app does
@@ -1,4 +1,5 @@
 import tkinter as tk
+from threading import RLock
 
 import matplotlib
 
@@ -6,8 +7,10 @@ from config import Config
 from gui.config_menu_window import ConfigMenuWindow
 from gui.simulation_frame import SimulationFrame
 from gui.statistics_frame import StatisticsFrame
-from gui.utils import center_window, SimulationTimer
+from gui.utils import center_window, SimulationTimer, SnapshotBuffer
 from world import Map
+from world.recorder import FrameRecorder, TurnRecorder
+from world.snapshot import Snapshot
 
 
 class MainWindow:
@@ -21,6 +24,15 @@ class MainWindow:
 
         self.simulation_timer = None
 
+        # the map is only touched under this lock, turns run on the timer thread
+        self.map_lock = RLock()
+        self.turn = 0
+        # only used when the GUI is decoupled from the simulation, see Config.render_fps
+        self.snapshot_buffer = None
+        # only used when turns are recorded, see Config.record_file and Config.frames_file
+        self.recorder = None
+        self.frame_recorder = None
+
         self.simulation_frame = None
         self.statistics_frame = None
 
@@ -33,24 +45,37 @@ class MainWindow:
         config_menu_window.start_loop()
 
         self.map.init()
+        self.turn = 0
+        if self.config.record_file:
+            self.recorder = TurnRecorder(self.config.record_file)
+        if self.config.frames_file:
+            self.frame_recorder = FrameRecorder(self.config.frames_file, self.config, every=self.config.frames_every)
+        self._record_turn()
 
         self.root = tk.Tk()
         self.root.title('Simulation')
-        self.root.protocol("WM_DELETE_WINDOW", exit)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
         self.simulation_timer = SimulationTimer(self._next_turn_update)
         self.simulation_timer.start()
 
-        self.simulation_frame = SimulationFrame(self)
-        self.statistics_frame = StatisticsFrame(self)
+        snapshot = self.take_snapshot(genes=False)
+        self.simulation_frame = SimulationFrame(self, snapshot)
+        self.statistics_frame = StatisticsFrame(self, snapshot)
 
         self.root.update()
         self.root.minsize(self.root.winfo_width(), self.root.winfo_height())
         center_window(self.root)
 
+        self.snapshot_buffer = None
+        if self.config.render_fps:
+            self.snapshot_buffer = SnapshotBuffer()
+            self.root.after(self._frame_interval(), self._poll_snapshots)
+
         self.start_loop()
 
     def reinit(self):
+        self._close_recorders()
         self.root.quit()
         self.root.destroy()
         self.init()
@@ -59,11 +84,59 @@ class MainWindow:
         self.root.mainloop()
 
     def refresh(self):
-        self.statistics_frame.refresh()
-        self.simulation_frame.refresh()
+        snapshot = self.take_snapshot()
+        self.statistics_frame.refresh(snapshot)
+        self.simulation_frame.refresh(snapshot)
+
+    def take_snapshot(self, genes: bool = None) -> Snapshot:
+        """
+        Snapshot of the current turn, gene arrays are included by default only if their histograms are shown.
+        """
+        if genes is None:
+            genes = self.statistics_frame.show_gene_histograms
+        with self.map_lock:
+            return Snapshot(self.turn, self.map, genes=genes)
 
     def _next_turn_update(self):
-        self.map.next_turn()
-
-        self.statistics_frame.next_turn_update(self.refresh_complex)
-        self.simulation_frame.next_turn_update(self.refresh_complex)
+        with self.map_lock:
+            self.map.next_turn()
+            self.turn += 1
+            self._record_turn()
+            snapshot = self.take_snapshot(genes=self.refresh_complex and self.statistics_frame.show_gene_histograms)
+
+        if self.snapshot_buffer is not None:
+            self.snapshot_buffer.publish(snapshot)
+        else:
+            self._show_snapshot(snapshot, [snapshot.counts])
+
+    def _poll_snapshots(self):
+        # runs in the Tk main loop, frames published since the last poll except the latest one are dropped
+        snapshot, counts = self.snapshot_buffer.take()
+        if snapshot is not None:
+            self._show_snapshot(snapshot, counts)
+        self.root.after(self._frame_interval(), self._poll_snapshots)
+
+    def _show_snapshot(self, snapshot: Snapshot, counts: list[tuple]):
+        self.statistics_frame.next_turn_update(snapshot, counts, self.refresh_complex)
+        self.simulation_frame.next_turn_update(snapshot, self.refresh_complex)
+
+    def _record_turn(self):
+        if self.recorder is not None:
+            self.recorder.record(self.turn, self.map)
+        if self.frame_recorder is not None:
+            self.frame_recorder.record(self.turn, self.map)
+
+    def _close_recorders(self):
+        with self.map_lock:
+            recorders = [self.recorder, self.frame_recorder]
+            self.recorder = self.frame_recorder = None
+        for recorder in recorders:
+            if recorder is not None:
+                recorder.close()
+
+    def _on_close(self):
+        self._close_recorders()
+        exit()
+
+    def _frame_interval(self) -> int:
+        return max(1, int(1000 / self.config.render_fps))
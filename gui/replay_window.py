@@ -0,0 +1,36 @@
+import tkinter as tk
+
+import matplotlib
+
+from gui.simulation_frame import SimulationFrame
+from gui.utils import center_window
+from world.recorder import read_frames
+
+
+class ReplayWindow:
+    """
+    Window replaying a map recording of world.recorder.FrameRecorder - there is no simulation behind it,
+    frames are read from the memory-mapped file as they are shown
+    """
+
+    def __init__(self, file_name: str):
+        self.frames, self.config = read_frames(file_name)
+        if not len(self.frames):
+            raise ValueError(f'{file_name} has no frames to replay')
+
+        # SimulationFrame in replay mode drives itself
+        self.simulation_timer = None
+
+        matplotlib.rcParams.update({'font.size': 8})
+
+        self.root = tk.Tk()
+        self.root.title(f'Replay - {file_name}')
+        self.root.protocol("WM_DELETE_WINDOW", exit)
+
+        self.simulation_frame = SimulationFrame(self, frames=self.frames)
+
+        self.root.update()
+        self.root.minsize(self.root.winfo_width(), self.root.winfo_height())
+        center_window(self.root)
+
+        self.root.mainloop()
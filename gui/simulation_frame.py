@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import time
 import tkinter as tk
 from tkinter import ttk
 from typing import TYPE_CHECKING
@@ -14,6 +15,7 @@ from gui.utils import show_askyesno
 
 if TYPE_CHECKING:
     from gui.main_window import MainWindow
+    from world.snapshot import Snapshot
 
 
 class SimulationFrame:
@@ -22,14 +24,26 @@ class SimulationFrame:
     GRASS_CMAP_END = 0.8
     PREY_COLOR = 'royalblue'
     PREDATOR_COLOR = 'red'
-
-    def __init__(self, main_window: MainWindow):
+    # interval between frames of a replay, faster replays skip frames
+    REPLAY_TICK_MS = 16
+
+    def __init__(self, main_window: MainWindow, snapshot: Snapshot = None, frames: np.ndarray = None):
+        """
+        With `frames` (see world.recorder.read_frames) the frame replays a recording instead of showing the simulation
+        of `main_window`, and needs no snapshot.
+        """
         self.main_window = main_window
         root = main_window.root
+        self.root = root
         self.config = main_window.config
-        self.map = main_window.map
         self.simulation_timer = main_window.simulation_timer
 
+        self.frames = frames
+        self.frame_index = 0
+        self._replay_job = None
+        self._replay_position = 0.
+        self._replay_clock = 0.
+
         self.cmap = self._init_cmap()
 
         frame = ttk.Frame(root, relief='groove', borderwidth=3)
@@ -38,21 +52,33 @@ class SimulationFrame:
         self.fig = Figure(figsize=(5, 5))
 
         self.plot = self.fig.add_subplot(111)
-        self.plot.pcolor(self.map.get_map_for_render(), cmap=self.cmap, vmin=0,
-                         vmax=2 + self.config.max_plant_supply)
-
-        self.fig.gca().set_xticks([])
-        self.fig.gca().set_yticks([])
+        # a single image artist, only its data is replaced and blitted on every turn
+        render = snapshot.render if frames is None else frames['render'][0]
+        self.image = self.plot.imshow(render, cmap=self.cmap, vmin=0,
+                                      vmax=2 + self.config.max_plant_supply, origin='lower',
+                                      interpolation='nearest', aspect='auto', animated=True)
+
+        self.plot.set_xticks([])
+        self.plot.set_yticks([])
         self.fig.tight_layout()
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=frame)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
         self.canvas.draw()
 
         self.canvas.get_tk_widget().pack(expand=True, fill='both')
 
         # options frame
         options_frame = ttk.Frame(frame, relief='ridge', borderwidth=2)
+        if frames is None:
+            self._init_simulation_options(options_frame)
+        else:
+            self._init_replay_options(options_frame)
+        options_frame.pack(padx=2, pady=2)
 
+        frame.pack(side='right', expand=True, fill='both')
+
+    def _init_simulation_options(self, options_frame):
         button_start = ttk.Button(options_frame, text='Start', command=self._button_start_command)
         button_start.pack(side='left')
 
@@ -74,23 +100,59 @@ class SimulationFrame:
                                         relief=tk.GROOVE, width=6, fg='white', bg='#007aff')
         self.button_refresh.pack(side='left')
 
-        options_frame.pack(padx=2, pady=2)
+    def _init_replay_options(self, options_frame):
+        button_play = ttk.Button(options_frame, text='Play', command=self._button_play_command)
+        button_play.pack(side='left')
 
-        frame.pack(side='right', expand=True, fill='both')
+        button_pause = ttk.Button(options_frame, text='Pause', command=self._button_pause_command)
+        button_pause.pack(side='left')
 
-    def next_turn_update(self, refresh_complex=True):
-        if refresh_complex:
-            self.plot.clear()
-            self.plot.pcolor(self.map.get_map_for_render(), cmap=self.cmap, vmin=0,
-                             vmax=2 + self.config.max_plant_supply)
+        # frames per second, 2 ** value like the simulation speed
+        self.var_replay_speed = tk.IntVar(value=3)
+        scale_replay_speed = ttk.Scale(options_frame, orient='horizontal', from_=-2, to=14,
+                                       variable=self.var_replay_speed)
+        scale_replay_speed.pack(side='left')
+
+        button_previous = ttk.Button(options_frame, text='<', width=2, command=self._button_previous_command)
+        button_previous.pack(side='left')
 
-            self.fig.gca().set_xticks([])
-            self.fig.gca().set_yticks([])
+        self.var_frame_index = tk.DoubleVar(value=0)
+        scale_frame_index = ttk.Scale(options_frame, orient='horizontal', from_=0, to=len(self.frames) - 1,
+                                      variable=self.var_frame_index, command=self._seek_command)
+        scale_frame_index.pack(side='left')
 
-            self.canvas.draw()
+        button_next = ttk.Button(options_frame, text='>', width=2, command=self._button_next_command)
+        button_next.pack(side='left')
 
-    def refresh(self):
-        self.next_turn_update()
+        self.label_turn = ttk.Label(options_frame, width=12)
+        self.label_turn.pack(side='left')
+        self.show_frame(0)
+
+    def next_turn_update(self, snapshot: Snapshot, refresh_complex=True):
+        if refresh_complex:
+            self._draw_render(snapshot.render)
+
+    def show_frame(self, index: int):
+        """
+        Replay mode: show the frame at `index` of the recording.
+        """
+        self.frame_index = index
+        # only this frame is read from the memory-mapped file
+        self._draw_render(self.frames['render'][index])
+        self.var_frame_index.set(index)
+        self.label_turn.config(text=f'Turn {self.frames["turn"][index]}')
+
+    def _draw_render(self, render: np.ndarray):
+        self.image.set_data(render)
+        self.plot.draw_artist(self.image)
+        self.canvas.blit(self.plot.bbox)
+
+    def refresh(self, snapshot: Snapshot):
+        self.next_turn_update(snapshot)
+
+    def _on_draw(self, event):
+        # animated artists are left out of full redraws (e.g. after a resize)
+        self.plot.draw_artist(self.image)
 
     def _init_cmap(self):
         grass_cmap = plt.get_cmap(SimulationFrame.GRASS_CMAP)
@@ -100,6 +162,47 @@ class SimulationFrame:
 
         return ListedColormap([SimulationFrame.PREY_COLOR, SimulationFrame.PREDATOR_COLOR] + grass_cmap_list)
 
+    def _button_play_command(self):
+        if self._replay_job is not None:
+            return
+        if self.frame_index == len(self.frames) - 1:
+            self.show_frame(0)
+        self._replay_position = float(self.frame_index)
+        self._replay_clock = time.perf_counter()
+        self._replay_job = self.root.after(SimulationFrame.REPLAY_TICK_MS, self._replay_tick)
+
+    def _button_pause_command(self):
+        if self._replay_job is not None:
+            self.root.after_cancel(self._replay_job)
+            self._replay_job = None
+
+    def _replay_tick(self):
+        # the position follows the wall clock, so frames that cannot be drawn in time are skipped, never read
+        now = time.perf_counter()
+        self._replay_position += (now - self._replay_clock) * 2 ** self.var_replay_speed.get()
+        self._replay_clock = now
+        index = min(int(self._replay_position), len(self.frames) - 1)
+        if index != self.frame_index:
+            self.show_frame(index)
+        if index == len(self.frames) - 1:
+            self._replay_job = None
+        else:
+            self._replay_job = self.root.after(SimulationFrame.REPLAY_TICK_MS, self._replay_tick)
+
+    def _button_previous_command(self):
+        self._button_pause_command()
+        self.show_frame(max(self.frame_index - 1, 0))
+
+    def _button_next_command(self):
+        self._button_pause_command()
+        self.show_frame(min(self.frame_index + 1, len(self.frames) - 1))
+
+    def _seek_command(self, value):
+        index = int(round(float(value)))
+        if index != self.frame_index:
+            self._replay_position = float(index)
+            self.show_frame(index)
+
     def _button_next_turn_command(self):
         self.simulation_timer.trigger_action()
 
@@ -10,34 +10,43 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
 
+from config import Config
 from gui.simulation_frame import SimulationFrame
-from world import Map
+from gui.time_series import TimeSeries
+from world.enumerators import Species
 from world.genome import N_GENES, GENE_NAMES
+from world.statistics import species_histograms
 
 if TYPE_CHECKING:
     from gui.main_window import MainWindow
+    from world.snapshot import Snapshot
 
 HISTOGRAM_N_BINS = 20
 ENERGY_HISTOGRAM_STEP = 50
 
 
 class PopulationGraphFrame:
-    def __init__(self, root, world_map: Map):
-        self.statistics = world_map.statistics
+    SERIES = ['Prey', 'Predators', 'Grass']
 
+    def __init__(self, root, snapshot: Snapshot):
         self.frame = ttk.Frame(root, relief='ridge', borderwidth=2)
 
         # plot
-        self.n_turns = 0
-        self.x = []
-        self.n_prey = []
-        self.n_predators = []
-        self.n_grass = []
+        self.history = TimeSeries(len(PopulationGraphFrame.SERIES))
 
         self.fig = Figure(figsize=(4, 2.8))
 
         self.plot = self.fig.add_subplot(111)
         self.plot.set_title('Population graph')
+        self.plot.xaxis.set_major_locator(MaxNLocator(integer=True))
+        self.plot.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+        # one persistent line per series, only their data is replaced on every turn
+        colors = [SimulationFrame.PREY_COLOR, SimulationFrame.PREDATOR_COLOR,
+                  plt.get_cmap(SimulationFrame.GRASS_CMAP)(SimulationFrame.GRASS_CMAP_END)]
+        self.lines = {}
+        for text, color in zip(PopulationGraphFrame.SERIES, colors):
+            self.lines[text], = self.plot.plot([], [], label=text, color=color)
 
         self.fig.tight_layout()
         self.fig.subplots_adjust(bottom=0.15)
@@ -50,9 +59,10 @@ class PopulationGraphFrame:
         options_frame = ttk.Frame(self.frame, relief='ridge', borderwidth=2)
 
         self.show_variables = {}
-        for text in ['Prey', 'Predators', 'Grass', 'Markers']:
+        for text in PopulationGraphFrame.SERIES + ['Markers']:
             self.show_variables[text] = tk.BooleanVar(value=text in ['Prey', 'Predators'])
-            button = ttk.Checkbutton(options_frame, text=text, variable=self.show_variables[text], command=self._redraw)
+            button = ttk.Checkbutton(options_frame, text=text, variable=self.show_variables[text],
+                                     command=self._update_style)
             button.pack(side='left')
 
         self.n_last = None
@@ -63,73 +73,81 @@ class PopulationGraphFrame:
 
         options_frame.pack(side='bottom', padx=2, pady=2)
 
+        self._add_counts([snapshot.counts])
+        self._update_style(redraw=False)
+
     def pack(self, *args, **kwargs):
         self.frame.pack(*args, **kwargs)
         self._redraw()
 
-    def update(self):
-        self._update_next_turn()
+    def update(self, counts: list[tuple]):
+        self._add_counts(counts)
         self._redraw()
 
-    def _update_next_turn(self):
-        self.x.append(self.n_turns)
-        self.n_turns += 1
-        self.n_prey.append(self.statistics.get_n_prey())
-        self.n_predators.append(self.statistics.get_n_predators())
-        self.n_grass.append(self.statistics.get_n_grass())
+    def _add_counts(self, counts: list[tuple]):
+        for turn, *values in counts:
+            self.history.append(turn, values)
 
-    def _redraw(self):
-        self.plot.clear()
-
-        plot_fun = self.plot.plot
-        if self.n_turns == 1:
-            plot_fun = self.plot.scatter
-
-        marker = '.' if self.show_variables['Markers'].get() else None
-        is_empty_plot = True
-        if self.show_variables['Prey'].get():
-            is_empty_plot = False
-            plot_fun(self.x[self.n_last:], self.n_prey[self.n_last:], label='Prey', marker=marker,
-                     c=SimulationFrame.PREY_COLOR)
-        if self.show_variables['Predators'].get():
-            is_empty_plot = False
-            plot_fun(self.x[self.n_last:], self.n_predators[self.n_last:], label='Predators', marker=marker,
-                     c=SimulationFrame.PREDATOR_COLOR)
-        if self.show_variables['Grass'].get():
-            is_empty_plot = False
-            plot_fun(self.x[self.n_last:], self.n_grass[self.n_last:], label='Grass', marker=marker,
-                     color=plt.get_cmap(SimulationFrame.GRASS_CMAP)(SimulationFrame.GRASS_CMAP_END))
+    def _update_style(self, redraw=True):
+        visible_lines = []
+        for text, line in self.lines.items():
+            line.set_visible(self.show_variables[text].get())
+            if line.get_visible():
+                visible_lines.append(line)
 
-        self.plot.set_title('Population graph')
-        if not is_empty_plot:
-            self.plot.legend(loc='lower center', ncol=3, bbox_to_anchor=(0.5, -0.22))
-        self.plot.set_ylim(bottom=0)
+        legend = self.plot.get_legend()
+        if legend is not None:
+            legend.remove()
+        if visible_lines:
+            self.plot.legend(handles=visible_lines, loc='lower center', ncol=3, bbox_to_anchor=(0.5, -0.22))
+
+        if redraw:
+            self._redraw()
+
+    def _redraw(self):
+        # a single point is only visible with a marker
+        marker = '.' if self.show_variables['Markers'].get() or len(self.history) == 1 else 'None'
+        x, values = self.history.window(self.n_last)
+        for i, line in enumerate(self.lines.values()):
+            line.set_data(x, values[:, i])
+            line.set_marker(marker)
 
-        self.fig.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
-        self.fig.gca().yaxis.set_major_locator(MaxNLocator(integer=True))
+        self.plot.relim(visible_only=True)
+        self.plot.autoscale_view()
+        self.plot.set_ylim(bottom=0, auto=None)
 
         self.canvas.draw()
 
     def _update_n_last(self, value):
-        self.n_last = [-10, -20, -50, -100, -200, -400, -1000, None][self.var_n_last.get()]
+        self.n_last = [10, 20, 50, 100, 200, 400, 1000, None][self.var_n_last.get()]
         self._redraw()
 
 
-class EnergiesHistogramsFrame:
-    def __init__(self, root, prey_energies: list | np.array = None, predator_energies: list | np.array = None):
+class SpeciesHistogramsFrame:
+    """
+    Prey and predator histograms side by side, drawn as persistent bars whose heights are updated in place
+    """
+
+    def __init__(self, root, title: str, bin_range: tuple[float, float]):
         self.root = root
+        self.title = title
 
-        self.prey_energies = prey_energies if prey_energies is not None else []
-        self.predator_energies = predator_energies if predator_energies is not None else []
+        self.counts = np.zeros((len(Species), HISTOGRAM_N_BINS), dtype=np.int64)
 
         self.frame = ttk.Frame(root, relief='ridge', borderwidth=2)
 
         self.fig = Figure(figsize=(5, 1.6))
 
-        self.prey_plot = self.fig.add_subplot(1, 2, 1)
-        self.predator_plot = self.fig.add_subplot(1, 2, 2)
+        self.plots = [self.fig.add_subplot(1, 2, 1), self.fig.add_subplot(1, 2, 2)]
+        self.bars = []
+        for plot, plot_title in zip(self.plots, ['Prey', 'Predators']):
+            plot.set_title(plot_title)
+            self.bars.append(plot.bar(np.zeros(HISTOGRAM_N_BINS), self.counts[0], align='edge'))
+
+        self.bin_range = None
+        self._set_bin_range(bin_range)
 
-        self.fig.suptitle('Energy')
+        self.fig.suptitle(self.title)
         self.fig.tight_layout()
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame)
@@ -140,44 +158,62 @@ class EnergiesHistogramsFrame:
         self.frame.pack(*args, **kwargs)
         self._redraw()
 
-    def update(self, prey_energies: np.array, predator_energies: np.array):
-        self.prey_energies = prey_energies
-        self.predator_energies = predator_energies
+    def update_counts(self, counts: np.ndarray, bin_range: tuple[float, float] = None):
+        """
+        Show new bin counts of shape (len(Species), HISTOGRAM_N_BINS), optionally over a new range.
+        """
+        if bin_range is not None and bin_range != self.bin_range:
+            self._set_bin_range(bin_range)
+        self.counts = counts
         self._redraw()
 
+    def _set_bin_range(self, bin_range: tuple[float, float]):
+        self.bin_range = bin_range
+        low, high = bin_range
+        if high <= low:  # the same widening as in species_histograms
+            low, high = low - 0.5, high + 0.5
+        width = (high - low) / HISTOGRAM_N_BINS
+        for plot, bars in zip(self.plots, self.bars):
+            for i, bar in enumerate(bars):
+                bar.set_x(low + i * width)
+                bar.set_width(width)
+            plot.set_xlim(low, high)
+
     def _redraw(self):
-        self.prey_plot.clear()
-        self.prey_plot.set_title(f'Prey')
-        self.predator_plot.clear()
-        self.predator_plot.set_title(f'Predators')
+        for plot, bars, counts in zip(self.plots, self.bars, self.counts):
+            for bar, count in zip(bars, counts):
+                bar.set_height(count)
+            plot.set_ylim(0, max(counts.max(), 1) * 1.05)
 
-        self.fig.suptitle('Energies')
+        self.canvas.draw()
 
-        max_energy = max(max(self.prey_energies) if self.prey_energies else 200,
-                         max(self.predator_energies) if self.predator_energies else 200)
-        xmax = max_energy + ENERGY_HISTOGRAM_STEP - max_energy % ENERGY_HISTOGRAM_STEP
 
-        self.prey_plot.hist(self.prey_energies, bins=HISTOGRAM_N_BINS, range=(0, xmax))
-        self.predator_plot.hist(self.predator_energies, bins=HISTOGRAM_N_BINS, range=(0, xmax))
+class EnergiesHistogramsFrame(SpeciesHistogramsFrame):
+    def __init__(self, root, snapshot: Snapshot):
+        super().__init__(root, 'Energies', (0, ENERGY_HISTOGRAM_STEP))
+        self.update(snapshot)
 
-        self.canvas.draw()
+    def update(self, snapshot: Snapshot):
+        # a species without animals counts as having 200 energy
+        max_energy = max(snapshot.energy[snapshot.species == species].max()
+                         if (snapshot.species == species).any() else 200 for species in Species)
+        xmax = max_energy + ENERGY_HISTOGRAM_STEP - max_energy % ENERGY_HISTOGRAM_STEP
+        self.update_counts(species_histograms(snapshot.species, snapshot.energy, (0, xmax), HISTOGRAM_N_BINS),
+                           (0, xmax))
 
 
 class PopulationStatisticsFrame:
-    def __init__(self, root, world_map: Map, statistics_frame: StatisticsFrame):
+    def __init__(self, root, snapshot: Snapshot, statistics_frame: StatisticsFrame):
         self.statistics_frame = statistics_frame
 
-        self.statistics = world_map.statistics
-
         self.frame = ttk.Frame(root, relief='groove', borderwidth=3)
 
         # population graph
-        self.population_graph_frame = PopulationGraphFrame(self.frame, world_map)
+        self.population_graph_frame = PopulationGraphFrame(self.frame, snapshot)
         self.population_graph_frame.pack(expand=False, fill='x')
 
         # energies histogram
-        self.prey_energies, self.predator_energies = self.statistics.get_energies()
-        self.energies_histograms = EnergiesHistogramsFrame(self.frame)
+        self.energies_histograms = EnergiesHistogramsFrame(self.frame, snapshot)
         self.energies_histograms.pack(expand=False, fill='x')
 
         # gene histograms button
@@ -187,15 +223,11 @@ class PopulationStatisticsFrame:
 
     def pack(self, *args, **kwargs):
         self.frame.pack(*args, **kwargs)
-        self._redraw()
-
-    def update(self, refresh_complex=True):
-        self._redraw(refresh_complex)
 
-    def _redraw(self, refresh_complex=True):
-        self.population_graph_frame.update()
+    def update(self, snapshot: Snapshot, counts: list[tuple], refresh_complex=True):
+        self.population_graph_frame.update(counts)
         if refresh_complex:
-            self.energies_histograms.update(*self.statistics.get_energies())
+            self.energies_histograms.update(snapshot)
 
     def _button_gene_histograms_command(self):
         self.statistics_frame.negate_gene_histograms()
@@ -205,62 +237,19 @@ class PopulationStatisticsFrame:
             self.button_gene_histograms.config(text='Show genome histograms')
 
 
-class GeneHistogramsFrame:
-    def __init__(self, root, gene_name: str, gene_range: tuple[float, float], prey_genes: list | np.array = None,
-                 predator_genes: list | np.array = None):
-        self.root = root
-        self.gene_name = gene_name
-        self.gene_range = gene_range
+class GeneHistogramsFrame(SpeciesHistogramsFrame):
+    def __init__(self, root, gene_name: str, gene_range: tuple[float, float, float]):
+        super().__init__(root, gene_name, (gene_range[1], gene_range[2]))
 
-        self.prey_genes = prey_genes if prey_genes is not None else []
-        self.predator_genes = predator_genes if predator_genes is not None else []
-
-        self.frame = ttk.Frame(root, relief='ridge', borderwidth=2)
-
-        self.fig = Figure(figsize=(5, 1.6))
-
-        self.prey_plot = self.fig.add_subplot(1, 2, 1)
-        self.predator_plot = self.fig.add_subplot(1, 2, 2)
-
-        self.fig.suptitle(f'{self.gene_name}')
-        self.fig.tight_layout()
-
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(expand=True, fill='both')
-
-    def pack(self, *args, **kwargs):
-        self.frame.pack(*args, **kwargs)
-        self._redraw()
-
-    def update(self, prey_genes: np.array, predator_genes: np.array):
-        self.prey_genes = prey_genes
-        self.predator_genes = predator_genes
-        self._redraw()
-
-    def _redraw(self):
-        self.prey_plot.clear()
-        self.prey_plot.set_title(f'Prey')
-        self.predator_plot.clear()
-        self.predator_plot.set_title(f'Predators')
-
-        self.fig.suptitle(f'{self.gene_name}')
-
-        self.prey_plot.hist(self.prey_genes, bins=HISTOGRAM_N_BINS, range=(self.gene_range[1], self.gene_range[2]))
-        self.predator_plot.hist(self.predator_genes, bins=HISTOGRAM_N_BINS,
-                                range=(self.gene_range[1], self.gene_range[2]))
-
-        self.canvas.draw()
+    def update(self, species: np.ndarray, genes: np.ndarray):
+        self.update_counts(species_histograms(species, genes, self.bin_range, HISTOGRAM_N_BINS))
 
 
 class GenomeStatisticsFrame:
-    def __init__(self, root, world_map: Map):
-        self.statistics = world_map.statistics
-        self.config = world_map.config
+    def __init__(self, root, config: Config):
+        self.config = config
         self.gene_ranges = self.config.get_gene_ranges()
 
-        self.prey_gene_arrays, self.predator_gene_arrays = self.statistics.get_gene_arrays()
-
         self.frame = ttk.Frame(root, relief='groove', borderwidth=3)
 
         self.genome_histograms = []
@@ -271,50 +260,48 @@ class GenomeStatisticsFrame:
 
     def pack(self, *args, **kwargs):
         self.frame.pack(*args, **kwargs)
-        self.update()
 
     def unpack(self):
         self.frame.pack_forget()
 
-    def update(self):
-        self.prey_gene_arrays, self.predator_gene_arrays = self.statistics.get_gene_arrays()
-        self._redraw()
-
-    def _redraw(self):
+    def update(self, snapshot: Snapshot):
+        if not snapshot.has_genes():
+            return
         for i, gene_histograms in enumerate(self.genome_histograms):
-            gene_histograms.update(self.prey_gene_arrays[i], self.predator_gene_arrays[i])
+            gene_histograms.update(snapshot.species, snapshot.genes[:, i])
 
 
 class StatisticsFrame:
-    def __init__(self, main_window: MainWindow):
+    def __init__(self, main_window: MainWindow, snapshot: Snapshot):
+        self.main_window = main_window
         root = main_window.root
-        map_ = main_window.map
 
         self.show_gene_histograms = False
 
         frame = ttk.Frame(root, relief='groove', borderwidth=3)
 
-        self.population_statistics_frame = PopulationStatisticsFrame(frame, map_, self)
+        self.population_statistics_frame = PopulationStatisticsFrame(frame, snapshot, self)
         self.population_statistics_frame.pack(side='right', expand=True, fill='both')
 
-        self.genome_histograms_frame = GenomeStatisticsFrame(frame, map_)
+        self.genome_histograms_frame = GenomeStatisticsFrame(frame, main_window.config)
         self.genome_histograms_frame.pack(side='left', expand=True, fill='both')
         self.genome_histograms_frame.unpack()
 
         frame.pack(side='left', expand=True, fill='both')
 
-    def next_turn_update(self, refresh_complex=True):
-        self.population_statistics_frame.update(refresh_complex)
+    def next_turn_update(self, snapshot: Snapshot, counts: list[tuple], refresh_complex=True):
+        self.population_statistics_frame.update(snapshot, counts, refresh_complex)
         if refresh_complex and self.show_gene_histograms:
-            self.genome_histograms_frame.update()
+            self.genome_histograms_frame.update(snapshot)
 
-    def refresh(self):
+    def refresh(self, snapshot: Snapshot):
         if self.show_gene_histograms:
-            self.genome_histograms_frame.update()
+            self.genome_histograms_frame.update(snapshot)
 
     def negate_gene_histograms(self):
         self.show_gene_histograms = not self.show_gene_histograms
         if self.show_gene_histograms:
             self.genome_histograms_frame.pack(side='left', expand=True, fill='both')
+            self.genome_histograms_frame.update(self.main_window.take_snapshot(genes=True))
         else:
             self.genome_histograms_frame.unpack()
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated buffer of the last `capacity` rows of `width` values
+    """
+
+    def __init__(self, capacity: int, width: int):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, width))
+        self.start = 0
+        self.size = 0
+        self.n_pushed = 0
+
+    def push(self, row):
+        end = (self.start + self.size) % self.capacity
+        self.data[end] = row
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.n_pushed += 1
+
+    def last(self, n: int = None) -> np.ndarray:
+        """
+        Copy of the last `n` rows (all of them by default), oldest first.
+        """
+        n = self.size if n is None else min(n, self.size)
+        first = (self.start + self.size - n) % self.capacity
+        if first + n <= self.capacity:
+            return self.data[first:first + n].copy()
+        return np.concatenate([self.data[first:], self.data[:first + n - self.capacity]])
+
+
+class TimeSeries:
+    """
+    History of `n_values` values per turn, in memory bounded by the number of resolution levels.
+    Level 0 keeps the last `capacity` turns as they are, every next level keeps the last `capacity` means of `factor`
+    consecutive points of the level below. A new level is added whenever the coarsest one would start overwriting,
+    so the whole history is always available in at most `capacity` points.
+    """
+
+    def __init__(self, n_values: int, capacity: int = 2048, factor: int = 4):
+        if capacity % factor != 0:
+            raise ValueError('capacity must be a multiple of factor')
+        self.n_values = n_values
+        self.capacity = capacity
+        self.factor = factor
+
+        # every row is (x, *values)
+        self.levels = [RingBuffer(capacity, n_values + 1)]
+        # sums and counts of the incomplete block of every level, feeding the level above
+        self.block_sums = [np.zeros(n_values + 1)]
+        self.block_counts = [0]
+
+    def __len__(self) -> int:
+        return self.levels[0].n_pushed
+
+    def append(self, x, values):
+        row = np.empty(self.n_values + 1)
+        row[0] = x
+        row[1:] = values
+
+        for level in range(len(self.levels)):
+            if level == len(self.levels) - 1 and self.levels[level].size == self.capacity:
+                self._add_level()
+            self.levels[level].push(row)
+            if level == len(self.levels) - 1:
+                break
+
+            self.block_sums[level] += row
+            self.block_counts[level] += 1
+            if self.block_counts[level] < self.factor:
+                break
+            row = self.block_sums[level] / self.factor
+            self.block_sums[level] = np.zeros(self.n_values + 1)
+            self.block_counts[level] = 0
+
+    def window(self, n_last: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The points of the last `n_last` turns (the whole history by default) at the finest resolution that fits
+        in `capacity` points. Returns the x values and an array of shape (n_points, n_values).
+        """
+        n_turns = len(self) if n_last is None else min(n_last, len(self))
+        for level, buffer in enumerate(self.levels):
+            block = self.factor ** level
+            if n_turns <= self.capacity * block or level == len(self.levels) - 1:
+                rows = buffer.last(-(-n_turns // block))
+                if level > 0:
+                    # coarse levels lag behind by up to one block, end the series at the latest turn
+                    rows = np.concatenate([rows, self.levels[0].last(1)])
+                return rows[:, 0], rows[:, 1:]
+
+    def _add_level(self):
+        # the current coarsest level still holds the whole history, so the next one can be built from it
+        top = self.levels[-1]
+        blocks = top.last().reshape(-1, self.factor, self.n_values + 1).mean(axis=1)
+        level = RingBuffer(self.capacity, self.n_values + 1)
+        for row in blocks:
+            level.push(row)
+        self.levels.append(level)
+        self.block_sums.append(np.zeros(self.n_values + 1))
+        self.block_counts.append(0)
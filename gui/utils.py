@@ -1,6 +1,6 @@
 import tkinter as tk
 from sys import exit
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 from tkinter import messagebox
 
 
@@ -74,3 +74,32 @@ class SimulationTimer(Thread):
 
     def trigger_action(self):
         self.action()
+
+
+class SnapshotBuffer:
+    """
+    Double buffer between the simulation thread, which publishes a Snapshot after every turn, and the Tk main loop,
+    which takes the latest one whenever it redraws. Snapshots published in between are dropped, but their population
+    counts are kept, so the population graph does not lose any turn.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._latest = None
+        self._counts = []
+
+    def publish(self, snapshot):
+        with self._lock:
+            self._latest = snapshot
+            self._counts.append(snapshot.counts)
+
+    def take(self):
+        """
+        Return the latest snapshot (None if nothing was published since the last call) and the counts of every
+        snapshot published since the last call.
+        """
+        with self._lock:
+            snapshot, counts = self._latest, self._counts
+            self._latest = None
+            self._counts = []
+        return snapshot, counts
@@ -1,12 +1,22 @@
+import argparse
+
 from config import Config
 from gui.main_window import MainWindow
+from gui.replay_window import ReplayWindow
 from gui.utils import show_error
-from world import Map
+from world import create_map
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predator-prey simulation.')
+    parser.add_argument('--replay', metavar='FILE', help='replay a map recording instead of simulating, '
+                                                         'see python -m runner.headless --frames')
+    args = parser.parse_args()
     try:
-        config = Config()
-        map_ = Map(config)
-        main_frame = MainWindow(config, map_)
+        if args.replay is not None:
+            ReplayWindow(args.replay)
+        else:
+            config = Config()
+            map_ = create_map(config)
+            main_frame = MainWindow(config, map_)
     except Exception as err:
         show_error(f'Error. {err}')
@@ -0,0 +1,177 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+from config import Config
+from world import ENGINES, close_map, create_map
+from world.profiling import PhaseProfiler
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DEFAULT_GRID_SIZES = [30, 100, 300, 1000]
+DEFAULT_POPULATIONS = [(50, 10), (500, 100), (5000, 1000)]
+DEFAULT_VIEWRANGES = [2]
+DEFAULT_ENGINES = ['arrays', 'objects']
+
+
+def scenario_matrix(grid_sizes, populations, viewranges, genomes, engines) -> list[dict]:
+    """
+    Every combination of the given values, except populations that do not fit on their grid.
+    """
+    scenarios = []
+    for engine, grid_size, (n_prey, n_predator), viewrange, simulate_genomes in product(
+            engines, grid_sizes, populations, viewranges, genomes):
+        if n_prey + n_predator > grid_size ** 2:
+            continue
+        scenario = {'engine': engine, 'grid_size': grid_size, 'n_prey': n_prey, 'n_predator': n_predator,
+                    'viewrange': viewrange, 'simulate_genomes': simulate_genomes}
+        scenario['name'] = scenario_name(scenario)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def scenario_name(scenario: dict) -> str:
+    genomes = 'genomes' if scenario['simulate_genomes'] else 'random'
+    return f'{scenario["engine"]}-g{scenario["grid_size"]}-p{scenario["n_prey"]}x{scenario["n_predator"]}' \
+           f'-v{scenario["viewrange"]}-{genomes}'
+
+
+def scenario_config(base: dict, scenario: dict, seed: int) -> Config:
+    config = Config()
+    for attr, value in base.items():
+        setattr(config, attr, value)
+    config.engine = scenario['engine']
+    config.grid_size = scenario['grid_size']
+    config.n_prey = scenario['n_prey']
+    config.n_predator = scenario['n_predator']
+    config.simulate_genomes = scenario['simulate_genomes']
+    _, low, high = config.viewrange_range
+    config.viewrange_range = (scenario['viewrange'], min(low, scenario['viewrange']), max(high, scenario['viewrange']))
+    config.seed = seed
+    return config
+
+
+def run_scenario(base: dict, scenario: dict, n_turns: int, n_warmup: int, seed: int) -> dict:
+    """
+    Time `n_turns` turns of one scenario after `n_warmup` untimed ones. Meant to run in a fresh process,
+    so that the peak resident memory belongs to this scenario alone.
+    """
+    config = scenario_config(base, scenario, seed)
+    start = time.perf_counter()
+    world_map = create_map(config)
+    init_seconds = time.perf_counter() - start
+
+    try:
+        for _ in range(n_warmup):
+            world_map.next_turn()
+
+        world_map.profiler = PhaseProfiler(window=n_turns)
+        for _ in range(n_turns):
+            world_map.next_turn()
+        seconds = world_map.profiler.total_seconds()
+        final_n_prey, final_n_predators = world_map.statistics.get_n_prey(), world_map.statistics.get_n_predators()
+    finally:
+        close_map(world_map)
+
+    peak_rss_mb = None
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss_mb = peak_rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+    return {
+        **scenario,
+        'turns': n_turns,
+        'init_seconds': init_seconds,
+        'seconds': seconds,
+        'turns_per_second': n_turns / seconds if seconds > 0 else float('inf'),
+        'phase_seconds': {phase: stats['total_seconds'] for phase, stats in world_map.profiler.summary().items()},
+        'peak_rss_mb': peak_rss_mb,
+        'final_n_prey': final_n_prey,
+        'final_n_predators': final_n_predators,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """
+    Descriptions of the scenarios whose turns per second fell more than `threshold` (a fraction) below baseline.
+    """
+    baseline_by_name = {result['name']: result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_by_name.get(result['name'])
+        if reference is None:
+            continue
+        ratio = result['turns_per_second'] / reference['turns_per_second']
+        if ratio < 1. - threshold:
+            regressions.append(f'{result["name"]}: {result["turns_per_second"]:.2f} turns/s, '
+                               f'baseline {reference["turns_per_second"]:.2f} turns/s ({ratio - 1.:+.1%})')
+    return regressions
+
+
+def parse_population(value: str) -> tuple[int, int]:
+    n_prey, n_predator = value.split(':')
+    return int(n_prey), int(n_predator)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Measure turns per second of Map.next_turn over a scenario matrix.')
+    parser.add_argument('--config', help='base config JSON file, the Config defaults are used otherwise')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=DEFAULT_GRID_SIZES)
+    parser.add_argument('--populations', type=parse_population, nargs='+', default=DEFAULT_POPULATIONS,
+                        help='starting populations as PREY:PREDATORS')
+    parser.add_argument('--viewranges', type=float, nargs='+', default=DEFAULT_VIEWRANGES,
+                        help='default view range genes')
+    parser.add_argument('--genomes', choices=['on', 'off'], nargs='+', default=['on', 'off'],
+                        help='run with simulate_genomes on and/or off')
+    parser.add_argument('--engines', choices=list(ENGINES), nargs='+', default=DEFAULT_ENGINES)
+    parser.add_argument('-n', '--turns', type=int, default=20, help='timed turns per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed turns before timing')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='benchmark.json', help='JSON file the results are written to')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown against the baseline reported as a regression (default: 0.1 = 10%%)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    base = {}
+    if args.config is not None:
+        config = Config()
+        config.load(args.config)
+        base = dict(vars(config))
+
+    scenarios = scenario_matrix(args.grid_sizes, args.populations, args.viewranges,
+                                [genomes == 'on' for genomes in args.genomes], args.engines)
+    results = []
+    for scenario in scenarios:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_scenario, base, scenario, args.turns, args.warmup, args.seed).result()
+        slowest_phase = max(result['phase_seconds'], key=result['phase_seconds'].get)
+        print(f'{result["name"]:<40} {result["turns_per_second"]:>10.2f} turns/s  '
+              f'slowest phase {slowest_phase}  peak {result["peak_rss_mb"] or 0:.0f} MB', flush=True)
+        results.append(result)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
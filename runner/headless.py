@@ -0,0 +1,195 @@
+import argparse
+import csv
+import os
+import sys
+
+from config import Config
+from world import ENGINES, close_map, create_map
+from world.aggregates import SPECIES_NAMES
+from world.checkpoint import CheckpointWriter, load_checkpoint
+from world.enumerators import Genes
+from world.profiling import PhaseProfiler
+from world.recorder import FrameRecorder, TurnRecorder
+
+SUMMARY_FIELDS = ['turn', 'n_prey', 'n_predators', 'n_grass'] + [
+    f'{species}_{gene.name.lower()}_mean' for species in SPECIES_NAMES for gene in Genes
+]
+
+
+def turn_summary(turn: int, world_map) -> dict:
+    """
+    Population, grass and mean genes of both species after the given turn.
+    """
+    statistics = world_map.statistics
+    record = statistics.get_record()
+    summary = {
+        'turn': turn,
+        'n_prey': statistics.get_n_prey(),
+        'n_predators': statistics.get_n_predators(),
+        'n_grass': record['n_grass'],
+    }
+    for species in SPECIES_NAMES:
+        for gene in Genes:
+            mean = record[f'{species}_{gene.name.lower()}_mean']
+            summary[f'{species}_{gene.name.lower()}_mean'] = mean if mean is not None else ''
+    return summary
+
+
+def is_extinct(summary: dict) -> bool:
+    return summary['n_prey'] == 0 or summary['n_predators'] == 0
+
+
+def run(config: Config, n_turns: int, output=None, stop_at_extinction: bool = False,
+        profiler: PhaseProfiler = None, checkpoint: str = None, checkpoint_every: int = None,
+        resume: bool = False, record: str = None, frames: str = None, frames_every: int = 1,
+        frames_grids: bool = False) -> dict:
+    """
+    Run the simulation without any GUI, writing one CSV row per turn to `output` (a path or a file object),
+    one binary record per turn to `record` and the map of every `frames_every`-th turn to `frames` if given,
+    see world.recorder.
+    With `checkpoint`, the full state is saved to that file every `checkpoint_every` turns and after the last one;
+    with `resume` too, a run starts from the checkpoint if there is one, and goes on up to turn `n_turns`.
+    Returns the summary of the last simulated turn.
+    """
+    resuming = resume and checkpoint is not None and os.path.exists(checkpoint)
+    if resuming:
+        world_map, first_turn = load_checkpoint(checkpoint)
+    else:
+        world_map, first_turn = create_map(config), 0
+    world_map.profiler = profiler
+    summary = turn_summary(first_turn, world_map)
+    checkpoint_writer = CheckpointWriter(checkpoint) if checkpoint is not None else None
+    resume_after = first_turn if resuming else None
+    recorder = TurnRecorder(record, resume_after=resume_after) if record is not None else None
+    frame_recorder = FrameRecorder(frames, world_map.config, every=frames_every, grids=frames_grids,
+                                   resume_after=resume_after) if frames is not None else None
+    if not resuming:
+        record_turn(first_turn, world_map, recorder, frame_recorder)
+
+    append = resuming and isinstance(output, str) and os.path.exists(output)
+    if append:
+        truncate_output(output, first_turn)
+    file = open(output, 'a' if append else 'w', newline='') if isinstance(output, str) else output
+    try:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS) if file is not None else None
+        if writer is not None and not append:
+            writer.writeheader()
+        if writer is not None and not resuming:
+            writer.writerow(summary)
+
+        for turn in range(first_turn + 1, n_turns + 1):
+            world_map.next_turn()
+            summary = turn_summary(turn, world_map)
+            if writer is not None:
+                writer.writerow(summary)
+            record_turn(turn, world_map, recorder, frame_recorder)
+            if stop_at_extinction and is_extinct(summary):
+                break
+            if checkpoint_every and turn % checkpoint_every == 0 and turn < n_turns:
+                # rows up to the checkpoint have to be on disk before it, see truncate_output
+                flush_outputs(file, recorder, frame_recorder)
+                checkpoint_writer.save(world_map, turn)
+
+        if checkpoint_writer is not None:
+            flush_outputs(file, recorder, frame_recorder)
+            checkpoint_writer.save(world_map, summary['turn'])
+    finally:
+        if isinstance(output, str):
+            file.close()
+        if recorder is not None:
+            recorder.close()
+        if frame_recorder is not None:
+            frame_recorder.close()
+        if checkpoint_writer is not None:
+            checkpoint_writer.wait()
+        close_map(world_map)
+
+    return summary
+
+
+def record_turn(turn: int, world_map, recorder: TurnRecorder, frame_recorder: FrameRecorder):
+    if recorder is not None:
+        recorder.record(turn, world_map)
+    if frame_recorder is not None:
+        frame_recorder.record(turn, world_map)
+
+
+def flush_outputs(file, recorder: TurnRecorder, frame_recorder: FrameRecorder):
+    if file is not None:
+        file.flush()
+    if recorder is not None:
+        recorder.flush()
+    if frame_recorder is not None:
+        frame_recorder.flush()
+
+
+def truncate_output(file_name: str, last_turn: int):
+    """
+    Drop the rows an interrupted run wrote after `last_turn`, so that a run resumed from the checkpoint of that
+    turn can append to the file.
+    """
+    with open(file_name, newline='') as file:
+        rows = []
+        for row in csv.DictReader(file):
+            # rows come in turn order, and the last one may have been cut off
+            if None in row.values() or int(row['turn']) > last_turn:
+                break
+            rows.append(row)
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the predator-prey simulation without the GUI.')
+    parser.add_argument('config', nargs='?', default='config.json', help='config JSON file (default: config.json)')
+    parser.add_argument('-n', '--turns', type=int, default=1000, help='number of turns to simulate')
+    parser.add_argument('-o', '--output', default='-', help='per-turn CSV file, "-" for standard output')
+    parser.add_argument('--stop-at-extinction', action='store_true',
+                        help='stop as soon as prey or predators die out')
+    parser.add_argument('--seed', type=int, help='override the random seed of the config')
+    parser.add_argument('--profile', metavar='FILE', help='record time per phase and dump it as JSON to FILE')
+    parser.add_argument('--engine', choices=list(ENGINES), help='override the storage engine of the config')
+    parser.add_argument('--record', metavar='FILE',
+                        help='also stream per-turn records to the binary FILE, see world.recorder')
+    parser.add_argument('--frames', metavar='FILE',
+                        help='also record the map to the memory-mapped FILE for replaying, see main.py --replay')
+    parser.add_argument('--frames-every', type=int, default=1, metavar='N', help='record the map every N turns')
+    parser.add_argument('--frames-grids', action='store_true',
+                        help='record the prey, predator and plant grids along with the map')
+    parser.add_argument('--checkpoint', metavar='FILE', help='save the full simulation state to FILE (.npz)')
+    parser.add_argument('--checkpoint-every', type=int, metavar='N',
+                        help='also save the checkpoint every N turns, not only after the last one')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from the checkpoint FILE if it exists, with its config, up to turn --turns')
+    args = parser.parse_args(argv)
+    if args.resume and args.checkpoint is None:
+        parser.error('--resume needs --checkpoint')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = Config()
+    config.load(args.config)
+    if args.engine is not None:
+        config.engine = args.engine
+    if args.seed is not None:
+        config.seed = args.seed
+
+    output = sys.stdout if args.output == '-' else args.output
+    profiler = PhaseProfiler() if args.profile is not None else None
+    summary = run(config, args.turns, output=output, stop_at_extinction=args.stop_at_extinction, profiler=profiler,
+                  checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume,
+                  record=args.record, frames=args.frames, frames_every=args.frames_every,
+                  frames_grids=args.frames_grids)
+    if profiler is not None:
+        profiler.dump(args.profile)
+    if output is not sys.stdout:
+        print(f'Turn {summary["turn"]}: {summary["n_prey"]} prey, {summary["n_predators"]} predators, '
+              f'{summary["n_grass"]} grass')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import csv
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+
+from config import Config
+from runner.headless import SUMMARY_FIELDS, run, is_extinct
+from world import EnsembleMap
+
+RESULT_FIELDS = ['job', 'seed', 'extinct'] + SUMMARY_FIELDS
+
+
+def expand_jobs(grid: dict = None, cases: list[dict] = None, n_seeds: int = 1, first_seed: int = 0) -> list[dict]:
+    """
+    Cartesian product of the `grid` values, combined with every override dict of `cases`, times `n_seeds` seeds.
+    Every job is a dict with its index, its seed and the Config overrides to apply.
+    """
+    grid = grid or {}
+    cases = cases or [{}]
+    grid_points = [dict(zip(grid.keys(), values)) for values in product(*grid.values())]
+
+    jobs = []
+    for case, point, seed in product(cases, grid_points, range(first_seed, first_seed + n_seeds)):
+        jobs.append({'job': len(jobs), 'seed': seed, 'overrides': {**case, **point}})
+    return jobs
+
+
+def make_config(base: dict, overrides: dict) -> Config:
+    config = Config()
+    for attr, value in {**base, **overrides}.items():
+        if not hasattr(config, attr):
+            raise ValueError(f'{attr} is not a config parameter')
+        setattr(config, attr, value)
+    return config
+
+
+def run_job(base: dict, job: dict, n_turns: int, stop_at_extinction: bool) -> dict:
+    """
+    Run one job to completion and return its result row. Executed in the worker processes.
+    """
+    config = make_config(base, {**job['overrides'], 'seed': job['seed']})
+    summary = run(config, n_turns, stop_at_extinction=stop_at_extinction)
+    overrides = {f'config.{attr}': value for attr, value in job['overrides'].items()}
+    return {'job': job['job'], 'seed': job['seed'], 'extinct': is_extinct(summary), **overrides, **summary}
+
+
+def ensemble_groups(jobs: list[dict], n_workers: int) -> list[list[dict]]:
+    """
+    Jobs with the same overrides, split into groups small enough to keep `n_workers` processes busy.
+    """
+    by_overrides: dict[str, list[dict]] = {}
+    for job in jobs:
+        by_overrides.setdefault(json.dumps(job['overrides'], sort_keys=True), []).append(job)
+    group_size = math.ceil(len(jobs) / max(n_workers or os.cpu_count() or 1, 1))
+    return [same[i:i + group_size] for same in by_overrides.values() for i in range(0, len(same), group_size)]
+
+
+def run_ensemble(base: dict, jobs: list[dict], n_turns: int, stop_at_extinction: bool) -> list[dict]:
+    """
+    Run jobs with the same overrides as the replicas of one EnsembleMap and return their result rows.
+    The seeds of the jobs together seed the ensemble. Executed in the worker processes.
+    """
+    config = make_config(base, {**jobs[0]['overrides'], 'seed': [job['seed'] for job in jobs]})
+    ensemble = EnsembleMap(config, len(jobs), retire_extinct=stop_at_extinction)
+    while ensemble.turn < n_turns and ensemble.n_running:
+        ensemble.next_turn()
+
+    results = ensemble.results()
+    overrides = {f'config.{attr}': value for attr, value in jobs[0]['overrides'].items()}
+    rows = []
+    for replica, job in enumerate(jobs):
+        summary = {field: results[field][replica].item() for field in SUMMARY_FIELDS}
+        summary.update({field: '' for field, value in summary.items() if isinstance(value, float) and np.isnan(value)})
+        rows.append({'job': job['job'], 'seed': job['seed'], 'extinct': is_extinct(summary), **overrides, **summary})
+    return rows
+
+
+def run_sweep(base: Config, jobs: list[dict], n_turns: int, output, n_workers: int = None,
+              stop_at_extinction: bool = True, ensemble: bool = False) -> list[dict]:
+    """
+    Run the jobs on a pool of at most `n_workers` processes, appending every result to the `output` CSV
+    (a path or a file object) as soon as its job finishes. Returns the results sorted by job.
+    With `ensemble`, the jobs of a parameter set run together as the replicas of an EnsembleMap, see run_ensemble.
+    """
+    base = dict(vars(base))
+    override_fields = sorted({f'config.{attr}' for job in jobs for attr in job['overrides']})
+    fieldnames = RESULT_FIELDS[:3] + override_fields + RESULT_FIELDS[3:]
+
+    file = open(output, 'w', newline='') if isinstance(output, str) else output
+    results = []
+    try:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            if ensemble:
+                futures = [executor.submit(run_ensemble, base, group, n_turns, stop_at_extinction)
+                           for group in ensemble_groups(jobs, n_workers)]
+            else:
+                futures = [executor.submit(run_job, base, job, n_turns, stop_at_extinction) for job in jobs]
+            for future in as_completed(futures):
+                for result in future.result() if ensemble else [future.result()]:
+                    writer.writerow({attr: json.dumps(value) if isinstance(value, (list, tuple)) else value
+                                     for attr, value in result.items()})
+                    results.append(result)
+                file.flush()
+    finally:
+        if isinstance(output, str):
+            file.close()
+
+    return sorted(results, key=lambda result: result['job'])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of headless simulations on a process pool.')
+    parser.add_argument('config', nargs='?', default='config.json', help='base config JSON file (default: config.json)')
+    parser.add_argument('--grid', type=json.loads, default={},
+                        help='JSON object mapping config parameters to lists of values, e.g. '
+                             '\'{"food_efficiency_ratio": [0.5, 0.8], "mutation_ratio": [0.01, 0.05]}\'')
+    parser.add_argument('--cases', type=json.loads, default=None,
+                        help='JSON list of config override objects, combined with every grid point')
+    parser.add_argument('--seeds', type=int, default=1, help='number of seeds (replicates) per parameter set')
+    parser.add_argument('--first-seed', type=int, default=0, help='seed of the first replicate')
+    parser.add_argument('-n', '--turns', type=int, default=1000, help='maximum number of turns per run')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('-o', '--output', default='sweep.csv', help='aggregated results CSV file')
+    parser.add_argument('--run-after-extinction', action='store_true',
+                        help='keep simulating all turns after prey or predators die out')
+    parser.add_argument('--ensemble', action='store_true',
+                        help='run the seeds of every parameter set in lock-step as one ensemble per worker, '
+                             'see world.ensemble_map')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    base = Config()
+    base.load(args.config)
+
+    jobs = expand_jobs(args.grid, args.cases, args.seeds, args.first_seed)
+    print(f'Running {len(jobs)} jobs on {args.workers} workers')
+    run_sweep(base, jobs, args.turns, args.output, n_workers=args.workers,
+              stop_at_extinction=not args.run_after_extinction, ensemble=args.ensemble)
+
+
+if __name__ == '__main__':
+    main()
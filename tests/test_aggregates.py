@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from world.aggregates import Aggregates, COLUMN_NAMES, SPECIES_NAMES
+from world.enumerators import Species
+
+
+class Animals:
+    """
+    Living animals of a test, as species and rows of COLUMN_NAMES values.
+    """
+
+    def __init__(self):
+        self.species = np.zeros(0, dtype=np.int8)
+        self.values = np.zeros((0, len(COLUMN_NAMES)))
+
+    def columns(self):
+        return self.species, self.values[:, 0], self.values[:, 1:]
+
+    def add(self, species, values):
+        self.species = np.r_[self.species, species]
+        self.values = np.r_[self.values, values]
+
+    def remove(self, rows):
+        kept = np.ones(len(self.species), dtype=bool)
+        kept[rows] = False
+        self.species, self.values = self.species[kept], self.values[kept]
+
+
+def random_batch(rng, n):
+    # few distinct values, so that extremes are held by several animals
+    return rng.integers(0, 2, n).astype(np.int8), rng.integers(0, 20, (n, len(COLUMN_NAMES))).astype(np.float64)
+
+
+def assert_matches(aggregates: Aggregates, animals: Animals):
+    record = aggregates.record()
+    for s, species in zip(Species, SPECIES_NAMES):
+        values = animals.values[animals.species == s]
+        assert record[f'{species}_count'] == len(values)
+        if not len(values):
+            assert record[f'{species}_energy_mean'] is None
+            continue
+        for c, column in enumerate(COLUMN_NAMES):
+            assert record[f'{species}_{column}_total'] == pytest.approx(values[:, c].sum())
+            assert record[f'{species}_{column}_mean'] == pytest.approx(values[:, c].mean())
+            assert record[f'{species}_{column}_var'] == pytest.approx(values[:, c].var(), abs=1e-9)
+            assert record[f'{species}_{column}_min'] == values[:, c].min()
+            assert record[f'{species}_{column}_max'] == values[:, c].max()
+
+
+def test_adding_and_removing_batches_matches_recomputing():
+    rng = np.random.default_rng(0)
+    animals = Animals()
+    aggregates = Aggregates(animals.columns)
+    for _ in range(3):
+        species, values = random_batch(rng, 50)
+        animals.add(species, values)
+        aggregates.add(species, values)
+    assert_matches(aggregates, animals)
+
+    # down to no animals at all
+    for _ in range(5):
+        rows = rng.choice(len(animals.species), 30, replace=False)
+        aggregates.remove(animals.species[rows], animals.values[rows])
+        animals.remove(rows)
+        assert_matches(aggregates, animals)
+
+
+def test_extremes_are_looked_up_once_their_last_holder_leaves():
+    rng = np.random.default_rng(1)
+    animals = Animals()
+    aggregates = Aggregates(animals.columns)
+    species, values = random_batch(rng, 60)
+    animals.add(species, values)
+    aggregates.add(species, values)
+    aggregates.record()
+
+    # every animal holding a minimum or maximum of any column of the prey leaves
+    prey = animals.species == Species.PREY
+    prey_values = animals.values[prey]
+    holders = np.flatnonzero(prey & ((animals.values == prey_values.min(axis=0))
+                                     | (animals.values == prey_values.max(axis=0))).any(axis=1))
+    aggregates.remove(animals.species[holders], animals.values[holders])
+    animals.remove(holders)
+    assert_matches(aggregates, animals)
+
+
+def test_single_changes_and_merged_parts_match_recomputing():
+    rng = np.random.default_rng(2)
+    animals = Animals()
+    aggregates = Aggregates(animals.columns)
+    species, values = random_batch(rng, 40)
+    animals.add(species, values)
+    for s, row in zip(species, values):
+        aggregates.add_one(Species(s), row.tolist())
+    # one animal changes, another dies
+    new_row = values[0] + 100
+    aggregates.replace_one(Species(species[0]), values[0].tolist(), new_row.tolist())
+    aggregates.remove_one(Species(species[1]), values[1].tolist())
+    animals.values[0] = new_row
+    animals.remove([1])
+    assert_matches(aggregates, animals)
+
+    half = len(animals.species) // 2
+    first, second = Animals(), Animals()
+    first.add(animals.species[:half], animals.values[:half])
+    second.add(animals.species[half:], animals.values[half:])
+    merged, part = Aggregates(animals.columns), Aggregates(second.columns)
+    merged.add(first.species, first.values)
+    part.add(second.species, second.values)
+    merged.merge(part.get_state())
+    assert_matches(merged, animals)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from config import Config
+from world import ArrayMap
+from world.enumerators import Events, Genes, Species
+from world.genome import default_gene_array
+
+PREY, PREDATOR = Species.PREY, Species.PREDATOR
+
+
+def make_map(animals: list[tuple]) -> ArrayMap:
+    """
+    ArrayMap holding only the given (x, y, species, energy, max animal energy) animals, arrived in that order.
+    """
+    config = Config()
+    config.seed = 0
+    config.grid_size = 10
+    config.n_prey = config.n_predator = 0
+    world_map = ArrayMap(config)
+    x, y, species, energy, max_energy = (np.array(column) for column in zip(*animals))
+    genes = np.tile(default_gene_array(config), (len(animals), 1))
+    genes[:, Genes.MAX_ANIMAL_ENERGY] = max_energy
+    world_map.add_animals(x, y, energy.astype(np.float64), species.astype(np.int8), genes)
+    return world_map
+
+
+def test_animals_on_a_tile_pair_in_arrival_order():
+    world_map = make_map([(0, 0, PREY, 60, 150), (0, 0, PREY, 90, 150), (0, 0, PREY, 45, 150)])
+    pop = world_map.population
+    # the last one added arrived first
+    pop.arrival[:3] = [1, 2, 0]
+    world_map._process_interactions()
+
+    (first, second, child_energy), = world_map.matings
+    assert first.tolist() == [2] and second.tolist() == [0]
+    assert child_energy.tolist() == [(45 - 30 + 60 - 40) // world_map.config.child_energy_den]
+    # the odd one out is left alone
+    assert pop.energy[:3].tolist() == [40, 90, 30]
+
+
+def test_a_carcass_feeds_nobody():
+    world_map = make_map([(1, 1, PREY, 0, 150), (1, 1, PREDATOR, 50, 150)])
+    pop = world_map.population
+    world_map._kill(np.array([0]))
+    world_map.aggregates.events[:] = 0
+    world_map._process_interactions()
+
+    assert pop.energy[1] == 50 and pop.alive.tolist() == [False, True]
+    assert world_map.aggregates.events[Events.DEATHS] == 0
+    assert world_map.prey_count[1, 1] == 0 and world_map.predator_count[1, 1] == 1
+
+
+def test_predators_gain_energy_up_to_the_cap_of_the_first_animal():
+    world_map = make_map([
+        # the predator arrived first, its own cap applies
+        (2, 2, PREDATOR, 100, 150), (2, 2, PREY, 400, 150),
+        # the prey arrived first, its cap applies to the predator
+        (3, 3, PREY, 400, 120), (3, 3, PREDATOR, 60, 200),
+        (4, 4, PREDATOR, 50, 150), (4, 4, PREY, 40, 150),
+        # a well fed predator does not hunt
+        (5, 5, PREDATOR, 140, 150), (5, 5, PREY, 40, 150),
+    ])
+    pop = world_map.population
+    world_map._process_interactions()
+
+    gained = int(40 * world_map.config.food_efficiency_ratio)
+    assert pop.energy[[0, 3, 4, 6]].tolist() == [150, 120, 50 + gained, 140]
+    assert pop.alive.tolist() == [True, False, False, True, True, False, True, True]
+    assert world_map.aggregates.events[Events.PREDATIONS] == 3
+    assert world_map.aggregates.events[Events.DEATHS] == 3
@@ -0,0 +1,27 @@
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+from runner.benchmark import run_scenario, scenario_matrix
+from world import parallel_map
+
+
+def test_parallel_scenario_leaks_no_shared_memory(monkeypatch):
+    names = []
+
+    class RecordedGrids(parallel_map.SharedGrids):
+        def __init__(self, grid_size: int, name: str = None):
+            super().__init__(grid_size, name)
+            names.append(self.memory.name)
+
+    monkeypatch.setattr(parallel_map, 'SharedGrids', RecordedGrids)
+    scenario, = scenario_matrix([20], [(30, 10)], [2], [True], ['parallel'])
+    result = run_scenario({'n_workers': 2}, scenario, n_turns=3, n_warmup=1, seed=0)
+
+    assert result['turns'] == 3
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
+    assert not multiprocessing.active_children()
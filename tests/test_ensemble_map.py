@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from config import Config
+from world import ArrayMap, EnsembleMap
+from world.population import Population
+from world.recorder import FrameRecorder, read_frames
+
+
+def make_config(seed, **overrides) -> Config:
+    config = Config()
+    config.engine = 'arrays'
+    config.seed = seed
+    for attr, value in overrides.items():
+        setattr(config, attr, value)
+    return config
+
+
+@pytest.mark.parametrize('simulate_genomes', [True, False])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_one_replica_follows_array_map(seed, simulate_genomes):
+    config = make_config(seed, simulate_genomes=simulate_genomes)
+    world_map = ArrayMap(config)
+    ensemble = EnsembleMap(config, 1, retire_extinct=False)
+    for _ in range(100):
+        world_map.next_turn()
+        ensemble.next_turn()
+        expected, state = world_map.get_state(), ensemble.get_state()
+        for name, array in expected.items():
+            np.testing.assert_array_equal(state[name][0] if name == 'plants' else state[name], array, err_msg=name)
+        np.testing.assert_array_equal(ensemble.get_map_for_render(), world_map.get_map_for_render())
+
+
+def test_render_of_a_slot_is_the_render_of_its_replica():
+    config = make_config(3, n_prey=120, n_predator=80, grid_size=15)
+    ensemble = EnsembleMap(config, 4, retire_extinct=False)
+    for _ in range(10):
+        ensemble.next_turn()
+
+    state = ensemble.get_state()
+    for slot in range(ensemble.n_running):
+        mine = state['replica'] == slot
+        replica_state = {name: state[name][mine] for name in Population.COLUMNS}
+        replica_state.update({name: array for name, array in state.items() if name.startswith('aggregates_')})
+        replica_state.update({'plants': state['plants'][slot], 'animal_ID': state['animal_ID'],
+                              'arrival_ID': state['arrival_ID']})
+        world_map = ArrayMap(config)
+        world_map.set_state(replica_state)
+        np.testing.assert_array_equal(ensemble.get_map_for_render(slot), world_map.get_map_for_render())
+
+
+def test_extinct_replicas_are_retired():
+    config = make_config(4, n_prey=30, n_predator=30, food_efficiency_ratio=0.3)
+    ensemble = EnsembleMap(config, 20)
+    while ensemble.turn < 300 and ensemble.n_running == ensemble.n_replicas:
+        ensemble.next_turn()
+
+    retired = np.flatnonzero(ensemble.retired_turn >= 0)
+    assert len(retired)
+    assert not np.isin(retired, ensemble.replicas).any()
+    assert ensemble.plants.shape[0] == ensemble.n_running
+    assert ensemble.population.replica.max(initial=-1) < ensemble.n_running
+    results = ensemble.results()
+    assert ((results['n_prey'][retired] == 0) | (results['n_predators'][retired] == 0)).all()
+
+
+def test_frames_of_an_ensemble_are_of_its_rendered_slot(tmp_path):
+    config = make_config(4, n_prey=120, n_predator=80, grid_size=15)
+    ensemble = EnsembleMap(config, 3)
+    file_name = str(tmp_path / 'ensemble.frames')
+    expected = []
+    with FrameRecorder(file_name, config, grids=True) as recorder:
+        for turn in range(5):
+            ensemble.next_turn()
+            recorder.record(turn, ensemble)
+            expected.append((ensemble.get_map_for_render(), ensemble.prey_count[0].copy(),
+                             ensemble.predator_count[0].copy(), ensemble.plants[0].copy()))
+
+    frames, _ = read_frames(file_name)
+    assert len(frames) == 5
+    for frame, (render, prey_count, predator_count, plants) in zip(frames, expected):
+        np.testing.assert_array_equal(frame['render'], render)
+        np.testing.assert_array_equal(frame['prey_count'], prey_count)
+        np.testing.assert_array_equal(frame['predator_count'], predator_count)
+        np.testing.assert_array_equal(frame['plants'], plants)
@@ -0,0 +1,40 @@
+import pytest
+
+from config import Config
+from runner.headless import run
+
+N_TURNS = 20
+
+
+def make_config(engine: str) -> Config:
+    config = Config()
+    config.engine = engine
+    config.seed = 1
+    config.grid_size = 20
+    config.n_workers = 2
+    return config
+
+
+def outputs(directory) -> dict:
+    return {'output': str(directory / 'run.csv'), 'record': str(directory / 'run.rec'),
+            'frames': str(directory / 'run.frames')}
+
+
+@pytest.mark.parametrize('engine', ['objects', 'arrays', 'parallel', 'sparse'])
+def test_resumed_run_writes_what_a_full_run_does(tmp_path, engine):
+    full, resumed = tmp_path / 'full', tmp_path / 'resumed'
+    full.mkdir()
+    resumed.mkdir()
+    checkpoint = str(resumed / 'run.npz')
+
+    expected = run(make_config(engine), N_TURNS, frames_grids=True, **outputs(full))
+    run(make_config(engine), N_TURNS // 2, checkpoint=checkpoint, frames_grids=True, **outputs(resumed))
+    summary = run(make_config(engine), N_TURNS, checkpoint=checkpoint, resume=True, frames_grids=True,
+                  **outputs(resumed))
+
+    assert summary == expected
+    for name, path in outputs(full).items():
+        with open(path, 'rb') as file:
+            wanted = file.read()
+        with open(outputs(resumed)[name], 'rb') as file:
+            assert file.read() == wanted, name
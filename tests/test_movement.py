@@ -0,0 +1,73 @@
+import numpy as np
+
+from config import Config
+from world import Map, movement
+from world.enumerators import Genes, Species
+from world.movement import (choose_directions, direction_weights, grid_windows, redistribute_negative_weights,
+                            sample_direction, sample_directions, tile_value_coefficients)
+
+
+def random_animals(n: int, size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, size, n).astype(np.int32)
+    y = rng.integers(0, size, n).astype(np.int32)
+    species = rng.integers(0, 2, n).astype(np.int8)
+    genes = np.ones((n, len(Genes)))
+    genes[:, Genes.VIEWRANGE] = rng.uniform(0, 3, n)
+    prey_count = np.zeros((size, size), dtype=np.int32)
+    predator_count = np.zeros((size, size), dtype=np.int32)
+    for s, grid in ((Species.PREY, prey_count), (Species.PREDATOR, predator_count)):
+        np.add.at(grid, (x[species == s], y[species == s]), 1)
+    plants = rng.uniform(0, 5, (size, size)).astype(np.float32)
+    return dict(x=x, y=y, species=species, genes=genes, hungry=rng.random(n) < 0.5, prey_count=prey_count,
+                predator_count=predator_count, plants=plants)
+
+
+def test_directions_do_not_depend_on_window_blocks(monkeypatch):
+    animals = random_animals(1000, 25)
+    whole = choose_directions(**animals, rng=np.random.default_rng(1))
+    monkeypatch.setattr(movement, 'WINDOW_BLOCK', 7)
+    blocked = choose_directions(**animals, rng=np.random.default_rng(1))
+    np.testing.assert_array_equal(whole, blocked)
+
+
+def test_animal_weights_match_batched_weights():
+    config = Config()
+    config.seed = 2
+    config.grid_size = 15
+    config.n_prey = 60
+    config.n_predator = 30
+    config.mutation_ratio = 0.3
+    world_map = Map(config)
+    for _ in range(10):
+        world_map.next_turn()
+    animals = [animal for animal in world_map.animals if not animal.isDead]
+    rng = np.random.default_rng(0)
+    for animal in animals[::3]:
+        # well fed animals value tiles differently
+        animal.energy = 1000
+
+    radii = rng.integers(0, 4, len(animals))
+    x = np.array([animal.x for animal in animals])
+    y = np.array([animal.y for animal in animals])
+    species = np.array([animal.species for animal in animals])
+    genes = np.array([animal.genome.get_genes() for animal in animals])
+    hungry = np.array([not animal.check_if_energy_over_max() for animal in animals])
+    windows = grid_windows(x, y, world_map.prey_count, world_map.predator_count, world_map.plants)
+    expected = redistribute_negative_weights(direction_weights(windows, radii, tile_value_coefficients(
+        species, genes, hungry)))
+
+    weights = np.array([animal.direction_weights(int(radius)) for animal, radius in zip(animals, radii)])
+    np.testing.assert_allclose(weights, expected, rtol=1e-12, atol=1e-12)
+    # the animals saw others, both hungry and well fed
+    assert (weights != movement.DIRECTION_BASE_WEIGHTS).any(axis=1).mean() > 0.5
+    assert hungry.any() and not hungry.all()
+
+
+def test_sample_direction_matches_sample_directions():
+    rng = np.random.default_rng(3)
+    weights = rng.uniform(-1, 3, (500, movement.N_DIRECTIONS)).clip(0)
+    weights[::7] = 0.
+    uniform = rng.random(500)
+    expected = sample_directions(weights, uniform)
+    assert [sample_direction(row.tolist(), u) for row, u in zip(weights, uniform)] == expected.tolist()
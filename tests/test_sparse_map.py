@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from config import Config
+from world import ArrayMap, SparseMap
+from world.sparse_map import plant_units
+
+
+def make_config(**overrides) -> Config:
+    config = Config()
+    config.engine = 'sparse'
+    config.seed = 0
+    config.grid_size = 20
+    config.n_prey = 10
+    config.n_predator = 5
+    for attr, value in overrides.items():
+        setattr(config, attr, value)
+    return config
+
+
+@pytest.mark.parametrize('ratio, max_supply, scale, dtype', [
+    (0.2, 15, 10, np.uint16),
+    (0.25, 40, 100, np.uint16),
+    (0.0004, 15, 10000, np.uint32),
+    (0.2, 10000, 10, np.uint32),
+])
+def test_plant_units_hold_ratio_and_maximum(ratio, max_supply, scale, dtype):
+    assert plant_units(make_config(plant_regeneration_ratio=ratio, max_plant_supply=max_supply)) == (scale, dtype)
+
+
+@pytest.mark.parametrize('ratio, max_supply', [(1 / 3, 15), (0.2, 1e9)])
+def test_plant_units_reject_inexact_or_too_large_plants(ratio, max_supply):
+    with pytest.raises(ValueError):
+        SparseMap(make_config(plant_regeneration_ratio=ratio, max_plant_supply=max_supply))
+
+
+@pytest.mark.parametrize('ratio, max_supply', [(0.0004, 15), (0.2, 10000), (0.3, 40)])
+def test_plants_regrow(ratio, max_supply):
+    world_map = SparseMap(make_config(plant_regeneration_ratio=ratio, max_plant_supply=max_supply))
+    world_map.plant_units[:] = 0
+    for _ in range(5):
+        world_map._grow_plants()
+    np.testing.assert_allclose(world_map.plants, 5 * ratio, rtol=1e-6)
+
+
+def test_plants_are_read_only():
+    world_map = SparseMap(make_config())
+    with pytest.raises(ValueError):
+        world_map.plants[0, 0] = 3.
+
+
+@pytest.mark.parametrize('simulate_genomes', [True, False])
+def test_follows_array_map_from_the_same_state(simulate_genomes):
+    # a regeneration ratio exact in float32, so that the plants of both maps stay equal
+    config = make_config(plant_regeneration_ratio=0.25, grid_size=40, n_prey=150, n_predator=30,
+                         simulate_genomes=simulate_genomes)
+    world_map = ArrayMap(config)
+    world_map.next_turn()
+    sparse_map = SparseMap(config)
+    sparse_map.set_state(world_map.get_state())
+    sparse_map.rng.bit_generator.state = world_map.rng.bit_generator.state
+
+    for turn in range(150):
+        world_map.next_turn()
+        sparse_map.next_turn()
+        expected, state = world_map.get_state(), sparse_map.get_state()
+        for name, array in expected.items():
+            np.testing.assert_array_equal(state[name], array, err_msg=f'{name} after turn {turn}')
+        assert sparse_map.aggregates.n_grass == world_map.aggregates.n_grass
+        if turn % 10 == 0:
+            np.testing.assert_array_equal(sparse_map.get_map_for_render(), world_map.get_map_for_render())
+            np.testing.assert_array_equal(sparse_map.prey_count, world_map.prey_count)
+            np.testing.assert_array_equal(sparse_map.predator_count, world_map.predator_count)
+            x, y = np.array([0, 17, 39]), np.array([39, 5, 0])
+            for actual, wanted in zip(sparse_map.get_neighbourhood(x, y, 3), world_map.get_neighbourhood(x, y, 3)):
+                np.testing.assert_array_equal(actual, wanted)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from gui.time_series import RingBuffer, TimeSeries
+
+
+def test_ring_buffer_keeps_the_last_rows_when_it_wraps_around():
+    buffer = RingBuffer(capacity=4, width=2)
+    for i in range(6):
+        buffer.push([i, -i])
+
+    assert buffer.size == 4 and buffer.n_pushed == 6
+    np.testing.assert_array_equal(buffer.last(), [[2, -2], [3, -3], [4, -4], [5, -5]])
+    np.testing.assert_array_equal(buffer.last(3), [[3, -3], [4, -4], [5, -5]])
+    np.testing.assert_array_equal(buffer.last(10), buffer.last())
+    # a copy, not a view of the buffer
+    buffer.last()[:] = 0
+    assert buffer.last()[0, 0] == 2
+
+
+def filled_series(n_turns: int) -> TimeSeries:
+    series = TimeSeries(n_values=1, capacity=8, factor=2)
+    for turn in range(n_turns):
+        series.append(turn, [2 * turn])
+    return series
+
+
+def test_time_series_keeps_turns_as_they_are_within_capacity():
+    x, values = filled_series(8).window()
+    np.testing.assert_array_equal(x, np.arange(8))
+    np.testing.assert_array_equal(values[:, 0], 2 * np.arange(8))
+
+
+@pytest.mark.parametrize('n_last, block', [(None, 8), (40, 8), (32, 4), (16, 2), (10, 2), (8, 1)])
+def test_time_series_downsamples_to_means_of_blocks(n_last, block):
+    series = filled_series(40)
+    assert len(series) == 40 and len(series.levels) == 4
+
+    x, values = series.window(n_last)
+    # the means of whole blocks of turns, up to the latest turn
+    n_points = -(-(n_last or 40) // block)
+    expected = np.arange(40 - n_points * block, 40, block) + (block - 1) / 2
+    if block > 1:
+        expected = np.r_[expected, 39]
+    np.testing.assert_array_equal(x, expected)
+    np.testing.assert_array_equal(values[:, 0], 2 * x)
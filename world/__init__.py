@@ -1 +1,30 @@
 from .map import Map
+from .array_map import ArrayMap
+from .parallel_map import ParallelMap
+from .ensemble_map import EnsembleMap
+from .sparse_map import SparseMap
+
+ENGINES = {
+    'objects': Map,
+    'arrays': ArrayMap,
+    'parallel': ParallelMap,
+    'sparse': SparseMap,
+}
+
+
+def create_map(config):
+    """
+    Create the map for the storage engine selected in the config.
+    """
+    if config.engine not in ENGINES:
+        raise ValueError(f'{config.engine} is a wrong engine, choose one of: {", ".join(ENGINES)}')
+    return ENGINES[config.engine](config)
+
+
+def close_map(world_map):
+    """
+    Stop what a map runs besides itself, the worker processes and shared memory of a ParallelMap.
+    """
+    close = getattr(world_map, 'close', None)
+    if close is not None:
+        close()
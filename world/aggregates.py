@@ -0,0 +1,225 @@
+from typing import Callable
+
+import numpy as np
+
+from world.enumerators import Events, Genes, Species
+
+SPECIES_NAMES = ['prey', 'predator']
+
+# energy first, then the genes in Genes order
+COLUMN_NAMES = ['energy'] + [gene.name.lower() for gene in Genes]
+
+AGGREGATES = ['total', 'mean', 'var', 'min', 'max']
+
+EVENT_NAMES = [event.name.lower() for event in Events]
+
+# arrays making up the state of Aggregates, see Aggregates.get_state
+STATE_ARRAYS = ['count', 'mean', 'm2', 'min', 'max', 'min_count', 'max_count', 'events']
+
+RECORD_FIELDS = ['n_grass'] + EVENT_NAMES + [f'{species}_count' for species in SPECIES_NAMES] + [
+    f'{species}_{column}_{aggregate}'
+    for species in SPECIES_NAMES for column in COLUMN_NAMES for aggregate in AGGREGATES
+]
+
+
+class Aggregates:
+    """
+    Running per-species aggregates of the energy and genes of the living animals, kept up to date by the map
+    as its phases run: means and variances are merged batch by batch (Welford / Chan et al.), and can be taken back
+    out when animals die or change. Minima and maxima remember how many animals hold them, and are only looked up
+    again through `columns` (returning species, energies and genes of all living animals) once the last one is gone.
+    """
+
+    def __init__(self, columns: Callable[[], tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        self.columns = columns
+        self.n_grass = 0
+        # births, deaths and predations of the current turn, counted by the map, see Events
+        self.events = np.zeros(len(Events), dtype=np.int64)
+
+        shape = (len(Species), len(COLUMN_NAMES))
+        self.count = np.zeros(len(Species), dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.min_count = np.zeros(shape, dtype=np.int64)
+        self.max_count = np.zeros(shape, dtype=np.int64)
+
+        # single-animal changes are buffered and applied in batches
+        self._pending = {1: ([], []), -1: ([], [])}
+
+    def reset(self):
+        self.count[:] = 0
+        self.mean[:] = 0.
+        self.m2[:] = 0.
+        self.min[:] = np.inf
+        self.max[:] = -np.inf
+        self.min_count[:] = 0
+        self.max_count[:] = 0
+        for species, values in self._pending.values():
+            species.clear()
+            values.clear()
+
+    def observe(self, species: np.ndarray, values: np.ndarray):
+        """
+        Start over from the given animals. `values` holds one row of COLUMN_NAMES values per animal.
+        """
+        self.reset()
+        self.add(species, values)
+
+    def add(self, species: np.ndarray, values: np.ndarray):
+        for s in Species:
+            selected = values[species == s]
+            if len(selected):
+                self._add(s, selected)
+
+    def remove(self, species: np.ndarray, values: np.ndarray):
+        for s in Species:
+            selected = values[species == s]
+            if len(selected):
+                self._remove(s, selected)
+
+    def replace(self, species: np.ndarray, old_values: np.ndarray, new_values: np.ndarray):
+        self.remove(species, old_values)
+        self.add(species, new_values)
+
+    def add_one(self, species: Species, values: list):
+        self._pending[1][0].append(species)
+        self._pending[1][1].append(values)
+
+    def remove_one(self, species: Species, values: list):
+        self._pending[-1][0].append(species)
+        self._pending[-1][1].append(values)
+
+    def replace_one(self, species: Species, old_values: list, new_values: list):
+        self.remove_one(species, old_values)
+        self.add_one(species, new_values)
+
+    def flush(self):
+        # additions first, so that every value taken out has been put in, even if an animal changed twice
+        for sign in (1, -1):
+            species, values = self._pending[sign]
+            if not species:
+                continue
+            species_array = np.array(species, dtype=np.int8)
+            values_array = np.array(values, dtype=np.float64).reshape(-1, len(COLUMN_NAMES))
+            species.clear()
+            values.clear()
+            if sign > 0:
+                self.add(species_array, values_array)
+            else:
+                self.remove(species_array, values_array)
+
+    def record(self) -> dict:
+        """
+        The aggregates of the current turn as a flat dict with RECORD_FIELDS keys; the aggregates of a species
+        without animals are None.
+        """
+        self.flush()
+        self.refresh_extremes()
+
+        record = {'n_grass': self.n_grass}
+        record.update(zip(EVENT_NAMES, self.events.tolist()))
+        for s, species in zip(Species, SPECIES_NAMES):
+            count = int(self.count[s])
+            record[f'{species}_count'] = count
+            for c, column in enumerate(COLUMN_NAMES):
+                record[f'{species}_{column}_total'] = float(self.mean[s, c] * count) if count else None
+                record[f'{species}_{column}_mean'] = float(self.mean[s, c]) if count else None
+                record[f'{species}_{column}_var'] = float(self.m2[s, c] / count) if count else None
+                record[f'{species}_{column}_min'] = float(self.min[s, c]) if count else None
+                record[f'{species}_{column}_max'] = float(self.max[s, c]) if count else None
+        return record
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        """
+        Copies of the STATE_ARRAYS, with all buffered changes applied.
+        """
+        self.flush()
+        return {name: getattr(self, name).copy() for name in STATE_ARRAYS}
+
+    def merge(self, state: dict[str, np.ndarray]):
+        """
+        Add the animals and events of another Aggregates, given by its get_state, e.g. of another part of the map.
+        Its extremes must be up to date, see refresh_extremes.
+        """
+        for s in Species:
+            n_a, n_b = self.count[s], state['count'][s]
+            if not n_b:
+                continue
+            n = n_a + n_b
+            delta = state['mean'][s] - self.mean[s]
+            self.mean[s] += delta * (n_b / n)
+            self.m2[s] += state['m2'][s] + delta ** 2 * (n_a * n_b / n)
+            self.count[s] = n
+
+            low, high = state['min'][s], state['max'][s]
+            self.min_count[s] = np.where(low < self.min[s], state['min_count'][s],
+                                         self.min_count[s] + state['min_count'][s] * (low == self.min[s]))
+            self.min[s] = np.minimum(self.min[s], low)
+            self.max_count[s] = np.where(high > self.max[s], state['max_count'][s],
+                                         self.max_count[s] + state['max_count'][s] * (high == self.max[s]))
+            self.max[s] = np.maximum(self.max[s], high)
+        self.events += state['events']
+
+    def set_state(self, state: dict[str, np.ndarray]):
+        self.reset()
+        for name in STATE_ARRAYS:
+            getattr(self, name)[:] = state[name]
+
+    def _add(self, s: int, values: np.ndarray):
+        n_a, n_b = self.count[s], len(values)
+        n = n_a + n_b
+        mean_b = values.mean(axis=0)
+        delta = mean_b - self.mean[s]
+        self.mean[s] += delta * (n_b / n)
+        self.m2[s] += ((values - mean_b) ** 2).sum(axis=0) + delta ** 2 * (n_a * n_b / n)
+        self.count[s] = n
+
+        low = values.min(axis=0)
+        n_low = (values == low).sum(axis=0)
+        self.min_count[s] = np.where(low < self.min[s], n_low, self.min_count[s] + n_low * (low == self.min[s]))
+        self.min[s] = np.minimum(self.min[s], low)
+        high = values.max(axis=0)
+        n_high = (values == high).sum(axis=0)
+        self.max_count[s] = np.where(high > self.max[s], n_high, self.max_count[s] + n_high * (high == self.max[s]))
+        self.max[s] = np.maximum(self.max[s], high)
+
+    def _remove(self, s: int, values: np.ndarray):
+        n_ab, n_b = self.count[s], len(values)
+        n = n_ab - n_b
+        if n <= 0:
+            self.count[s] = 0
+            self.mean[s] = 0.
+            self.m2[s] = 0.
+            self.min[s] = np.inf
+            self.max[s] = -np.inf
+            self.min_count[s] = 0
+            self.max_count[s] = 0
+            return
+        mean_b = values.mean(axis=0)
+        mean = (n_ab * self.mean[s] - n_b * mean_b) / n
+        delta = mean_b - mean
+        m2 = self.m2[s] - ((values - mean_b) ** 2).sum(axis=0) - delta ** 2 * (n * n_b / n_ab)
+        self.mean[s] = mean
+        self.m2[s] = np.maximum(m2, 0.)
+        self.count[s] = n
+
+        self.min_count[s] -= (values == self.min[s]).sum(axis=0)
+        self.max_count[s] -= (values == self.max[s]).sum(axis=0)
+
+    def refresh_extremes(self):
+        """
+        Look up the minima and maxima that the animals holding them have taken along.
+        """
+        stale = ((self.min_count <= 0) | (self.max_count <= 0)) & (self.count > 0)[:, np.newaxis]
+        if not stale.any():
+            return
+        species, energy, genes = self.columns()
+        values = np.column_stack([energy, genes])
+        for s in np.flatnonzero(stale.any(axis=1)):
+            selected = values[species == s]
+            self.min[s] = selected.min(axis=0)
+            self.max[s] = selected.max(axis=0)
+            self.min_count[s] = (selected == self.min[s]).sum(axis=0)
+            self.max_count[s] = (selected == self.max[s]).sum(axis=0)
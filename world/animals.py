@@ -1,24 +1,20 @@
 from __future__ import annotations
 
-from random import choice, random
+import math
 from typing import TYPE_CHECKING
 
 from config import Config
-from world.enumerators import Species, Directions
+from world.enumerators import Species, Directions, Events
 from world.genome import Genome
-
-import numpy as np
+from world.movement import (DIRECTION_BASE_WEIGHTS, direction_kernel_terms, redistribute_negative_weight_list,
+                            sample_direction)
 
 if TYPE_CHECKING:
     from world import Map
-    from world.map import MapTile
     from world.animals import Animal
 
 
 class Animal:
-    n_prey = 0
-    n_predator = 0
-
     def __init__(self, x: int, y: int, init_energy: int, species: Species, id: int, map: Map, config: Config, genome: Genome = None):
         if genome is None:
             self.genome = Genome(config=config)
@@ -35,9 +31,9 @@ class Animal:
         self.energy_consumption = self.genome.calculate_energy_consumption()
 
         if self.species == Species.PREY:
-            Animal.n_prey += 1
+            self.map.n_prey += 1
         elif self.species == Species.PREDATOR:
-            Animal.n_predator += 1
+            self.map.n_predator += 1
         else:
             raise ValueError(f'{self.species} is a wrong species')
 
@@ -47,40 +43,52 @@ class Animal:
                 new_self_energy = self.energy // 3 * 2
                 new_other_energy = other.energy // 3 * 2
                 child_energy = ((self.energy - new_self_energy) + (other.energy - new_other_energy)) // self.config.child_energy_den
-                self.energy = new_self_energy
-                other.energy = new_other_energy
-                x, y = self.get_position()
-                self.map.add_child(
-                    x=x, y=y, init_energy=child_energy, species=self.species, 
-                    genome=Genome.combined_genome(
-                        first=self.genome,
-                        second=other.genome,
-                        config=self.config
-                    ))
+                self.set_energy(new_self_energy)
+                other.set_energy(new_other_energy)
+                self.map.add_mating(first=self, second=other, child_energy=child_energy)
 
         elif self.species == Species.PREY and other.species == Species.PREDATOR:
             if not other.check_if_energy_over_max():
+                self.map.aggregates.events[Events.PREDATIONS] += 1
                 self.die()
-                other.energy += int(self.energy*self.config.food_efficiency_ratio)
-                other.energy = min(other.energy, self.genome.max_animal_energy)
+                other.set_energy(min(other.energy + int(self.energy*self.config.food_efficiency_ratio),
+                                     self.genome.max_animal_energy))
 
         elif self.species == Species.PREDATOR and other.species == Species.PREY:
             if not self.check_if_energy_over_max():
+                self.map.aggregates.events[Events.PREDATIONS] += 1
                 other.die()
-                self.energy += int(other.energy*self.config.food_efficiency_ratio)
-                self.energy = min(self.energy, self.genome.max_animal_energy)
+                self.set_energy(min(self.energy + int(other.energy*self.config.food_efficiency_ratio),
+                                    self.genome.max_animal_energy))
+
+    def set_energy(self, energy):
+        """
+        Change the energy outside of moving, keeping the aggregates of the map up to date while alive.
+        """
+        if self.isDead:
+            self.energy = energy
+            return
+        old_values = self.get_aggregate_values()
+        self.energy = energy
+        self.map.aggregates.replace_one(self.species, old_values, self.get_aggregate_values())
+
+    def get_aggregate_values(self) -> list:
+        return [self.energy] + self.genome.get_genes()
 
     def die(self):
         if not self.isDead:
             self.isDead = True
+            self.map.update_counts(self.x, self.y, self.species, -1)
+            self.map.aggregates.remove_one(self.species, self.get_aggregate_values())
+            self.map.aggregates.events[Events.DEATHS] += 1
             if self.species == Species.PREY:
-                Animal.n_prey -= 1
+                self.map.n_prey -= 1
             else:
-                Animal.n_predator -= 1
+                self.map.n_predator -= 1
 
-    def move(self, direction, gridsize):
+    def move(self, direction, gridsize, energy_roll: float):
         energy_int = int(self.energy_consumption)
-        if random() > self.energy_consumption % 1 and self.energy_consumption != 1.:
+        if energy_roll > self.energy_consumption % 1 and self.energy_consumption != 1.:
             energy_int += 1
         self.energy = max(0, self.energy - energy_int)
 
@@ -98,89 +106,54 @@ class Animal:
         if self.energy <= 0:
             self.die()  # R.I.P.
 
-    def _calc_tile_choice_value(self, current_tile: MapTile) -> float:
-        result = 0.0
-        if not current_tile.is_empty():
-            prey_n, predator_n = current_tile.get_animal_counts()
-            if self.species == Species.PREY:
-                result -= predator_n * self.genome.fear_of_predator_ratio
-                result += prey_n / self.genome.eating_over_mating_ratio
-                result += current_tile.get_n_plants() * self.genome.eating_over_mating_ratio if not self.check_if_energy_over_max() else 0
-            else:
-                result += predator_n / self.genome.eating_over_mating_ratio
-                result += prey_n * self.genome.eating_over_mating_ratio if not self.check_if_energy_over_max() else 0
-        return result
-
-    def choose_direction(self) -> Directions:
+    def direction_weights(self, radius: int) -> list[float]:
+        """
+        Weight of every direction, negative ones redistributed, from the occupied tiles within `radius`:
+        the scalar version of the batched movement.choose_directions, in plain Python over the cached kernel.
+        """
+        genome = self.genome
+        hungry = not self.check_if_energy_over_max()
+        # coefficients of the prey count, predator count and whole plants in the value of a tile
+        if self.species == Species.PREY:
+            prey_value = 1. / genome.eating_over_mating_ratio
+            predator_value = -genome.fear_of_predator_ratio
+            plant_value = genome.eating_over_mating_ratio if hungry else 0.
+        else:
+            prey_value = genome.eating_over_mating_ratio if hungry else 0.
+            predator_value = 1. / genome.eating_over_mating_ratio
+            plant_value = 0.
+
+        world_map = self.map
+        tiles, plants = world_map.tiles, world_map.plants
+        prey_count, predator_count = world_map.prey_count, world_map.predator_count
+        size = self.config.grid_size
+        weights = DIRECTION_BASE_WEIGHTS.tolist()
+        for dx, dy, terms in direction_kernel_terms(radius):
+            x, y = (self.x + dx) % size, (self.y + dy) % size
+            # only tiles with animals on them are valued; animals that died this turn are still listed on theirs
+            if not tiles[x][y].animals:
+                continue
+            n_prey, n_predator = prey_count.item(x, y), predator_count.item(x, y)
+            if not n_prey and not n_predator:
+                continue
+            value = n_prey * prey_value + n_predator * predator_value + math.floor(plants.item(x, y)) * plant_value
+            for direction, weight in terms:
+                weights[direction] += weight * value
+        return redistribute_negative_weight_list(weights)
+
+    def choose_direction(self, viewrange_roll: float, direction_roll: float) -> Directions:
+        """
+        Rolls are uniform draws from [0, 1) made by the map in one batch for all animals.
+        """
         if not self.config.simulate_genomes:
-            return choice(list(Directions))
-        x, y = self.get_position()
+            return Directions(int(direction_roll * len(Directions)))
         current_viewrange = int(self.genome.viewrange)
-        if random() < self.genome.viewrange % 1 and self.genome.viewrange != 1.:
+        if viewrange_roll < self.genome.viewrange % 1 and self.genome.viewrange != 1.:
             current_viewrange += 1
-
-        neighbourhood: list[list[MapTile]] = self.map.get_submap(x=x, y=y, radius=current_viewrange)
-
-        n_size = current_viewrange*2 + 1
-
-        directions_weights = [1., 1., 1., 1., 1.] # []
-        for i in range(n_size):
-            for j in range(n_size):
-                tile_choice_value = self._calc_tile_choice_value(current_tile=neighbourhood[i][j])
-                x_dist = abs(i-current_viewrange)
-                y_dist = abs(j-current_viewrange)
-                if x_dist == 0 and y_dist == 0:
-                    directions_weights[4] = tile_choice_value
-                    
-                else:
-                    x_direction: Directions
-                    y_direction: Directions
-                    x_weight = float(x_dist)/(x_dist + y_dist)
-                    y_weight = float(y_dist)/(x_dist + y_dist)
-                    distance_weight = 1./(pow(x_dist, 2) + pow(y_dist, 2))
-
-                    if i > current_viewrange:
-                        x_direction = Directions.RIGHT
-                    elif i < current_viewrange:
-                        x_direction = Directions.LEFT
-                    else:
-                        x_direction = Directions.STAY
-
-                    if j > current_viewrange:
-                        y_direction = Directions.DOWN
-                    elif j < current_viewrange:
-                        y_direction = Directions.UP
-                    else:
-                        y_direction = Directions.STAY
-                    
-                    directions_weights[x_direction.value] += tile_choice_value * x_weight * distance_weight
-                    directions_weights[y_direction.value] += tile_choice_value * y_weight * distance_weight
-
-        # below lines handles negative values
-        for i in range(4):
-            if directions_weights[i] < 0.:
-                if i%2 == 0:
-                    directions_weights[i+1] -= directions_weights[i]
-                    directions_weights[i] = 0.
-                else:
-                    directions_weights[i-1] -= directions_weights[i]
-                    directions_weights[i] = 0.
-        
-        if directions_weights[4] < 0.:
-            for i in range(4):
-                directions_weights[i] -= directions_weights[4]/4
-            directions_weights[4] = 0.
-        directions_weights = np.array(directions_weights)
-        directions_weights /= directions_weights.sum()
-        return Directions(np.random.choice(a=np.array([0, 1, 2, 3, 4]), size=1, p=directions_weights))
+        return Directions(sample_direction(self.direction_weights(current_viewrange), direction_roll))
 
     def check_if_energy_over_max(self):
         return self.energy > self.config.max_energy_check_mult * int(self.genome.max_animal_energy)
 
     def get_position(self):
         return self.x, self.y
-
-    @classmethod
-    def reset_counts(cls):
-        cls.n_prey = 0
-        cls.n_predator = 0
@@ -0,0 +1,417 @@
+import numpy as np
+
+from config import Config
+from world.aggregates import Aggregates, STATE_ARRAYS
+from world.enumerators import Events, Species, Genes
+from world.genome import default_gene_array, combined_gene_arrays
+from world.movement import N_DIRECTIONS, DIRECTION_OFFSETS, choose_directions
+from world.neighbourhood import window_index
+from world.population import Population
+from world.profiling import PhaseProfiler
+from world.statistics import ArrayStatistics
+from world.utils import read_only_view
+
+
+class ArrayMap:
+    """
+    Map keeping its animals in a struct-of-arrays Population instead of Animal objects
+    """
+
+    PHASES = ('_clean_dead_animals', '_move_animals', '_process_interactions', '_put_newborns_on_map',
+              '_process_plants_eating_and_growing')
+
+    def __init__(self, config: Config):
+        self.population: Population = None
+        self.plants: np.ndarray = None
+        self._prey_count: np.ndarray = None
+        self._predator_count: np.ndarray = None
+        self._prey_count_view: np.ndarray = None
+        self._predator_count_view: np.ndarray = None
+        self.matings: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self.animal_ID: int = None
+        self.arrival_ID: int = None
+        self.rng: np.random.Generator = None
+        self.config = config
+        self.profiler: PhaseProfiler = None
+        self.aggregates = Aggregates(lambda: self.statistics.get_columns())
+
+        self.init()
+        self.statistics = ArrayStatistics(self.config, self)
+
+    @property
+    def prey_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living prey on every tile.
+        """
+        return self._prey_count_view
+
+    @property
+    def predator_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living predators on every tile.
+        """
+        return self._predator_count_view
+
+    def init(self):
+        self._clear(capacity=2 * (self.config.n_predator + self.config.n_prey))
+        self.rng = np.random.default_rng(self.config.seed)
+        self._init_species(self.config.n_predator, Species.PREDATOR)
+        self._init_species(self.config.n_prey, Species.PREY)
+        self.aggregates.n_grass = self._count_grass()
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        """
+        Copy of the state of the map between turns as NumPy arrays: plants, id counters, aggregates and the
+        Population columns.
+        """
+        if self.matings:
+            raise ValueError('The state of the map can only be taken between turns')
+        pop = self.population
+        state = {f'aggregates_{name}': array for name, array in self.aggregates.get_state().items()}
+        state.update({name: getattr(pop, name).copy() for name in pop.COLUMNS})
+        state.update({
+            'plants': self.plants.copy(),
+            'animal_ID': np.array(self.animal_ID, dtype=np.int64),
+            'arrival_ID': np.array(self.arrival_ID, dtype=np.int64),
+        })
+        return state
+
+    def set_state(self, state: dict[str, np.ndarray]):
+        """
+        Replace the plants, animals and aggregates of the map with a state from get_state. The random number
+        generator is left as it is.
+        """
+        n = len(state['x'])
+        self._clear(capacity=2 * n)
+        self._set_plants(state['plants'])
+        self.animal_ID = int(state['animal_ID'])
+        self.arrival_ID = int(state['arrival_ID'])
+
+        pop = self.population
+        pop.append(**{name: state[name] for name in pop.COLUMNS if name != 'alive'})
+        pop.alive[:] = state['alive']
+        self._update_counts(np.flatnonzero(pop.alive), 1)
+
+        self.aggregates.set_state({name: state[f'aggregates_{name}'] for name in STATE_ARRAYS})
+        self.aggregates.n_grass = self._count_grass()
+
+    def add_animals(self, x, y, init_energy, species, genes, **columns):
+        n = len(np.atleast_1d(x))
+        ids = np.arange(self.animal_ID + 1, self.animal_ID + n + 1)
+        arrivals = np.arange(self.arrival_ID, self.arrival_ID + n)
+        self.animal_ID += n
+        self.arrival_ID += n
+
+        start = self.population.size
+        self.population.append(x=x, y=y, energy=init_energy, species=species, id=ids, arrival=arrivals, genes=genes,
+                               **columns)
+        rows = np.arange(start, self.population.size)
+        self._update_counts(rows, 1)
+        self.aggregates.add(self.population.species[rows], self._aggregate_values(rows))
+
+    def get_map_for_render(self):
+        return self._render_rows(0, self.config.grid_size)
+
+    def count_animals(self) -> int:
+        return self.population.size + sum(len(child_energy) for _, _, child_energy in self.matings)
+
+    def get_neighbourhood(self, x, y, radius: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Prey counts, predator counts and plants within `radius` of (x, y), wrapped around the edges of the map.
+        Coordinate arrays give one window per position, see world.neighbourhood.window_index.
+        """
+        index = window_index(x, y, radius, self.plants.shape)
+        return self._prey_count[index], self._predator_count[index], self.plants[index]
+
+    def next_turn(self):
+        if self.profiler is not None:
+            self.profiler.run_turn(self)
+            return
+        self._clean_dead_animals()
+        self._move_animals()
+        self._process_interactions()
+        self._put_newborns_on_map()
+        self._process_plants_eating_and_growing()
+
+    def _clear(self, capacity: int):
+        self.population = Population(capacity=capacity)
+        self.plants, self._prey_count, self._predator_count = self._allocate_grids()
+        self._prey_count_view = read_only_view(self._prey_count)
+        self._predator_count_view = read_only_view(self._predator_count)
+        self.matings = []
+        self.animal_ID = 0
+        self.arrival_ID = 0
+        self.aggregates.reset()
+        self.aggregates.events[:] = 0
+
+    def _allocate_grids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Fresh plant, prey count and predator count grids.
+        """
+        size = self.config.grid_size
+        return (np.ones((size, size), dtype=np.float32), np.zeros((size, size), dtype=np.int32),
+                np.zeros((size, size), dtype=np.int32))
+
+    def _render_rows(self, start: int, stop: int) -> np.ndarray:
+        """
+        get_map_for_render of the rows start..stop of the map.
+        """
+        return self._render_grids(self.plants[start:stop], self._prey_count[start:stop],
+                                  self._predator_count[start:stop], start)
+
+    def _render_grids(self, plants: np.ndarray, prey_count: np.ndarray, predator_count: np.ndarray, start: int = 0,
+                      animals: np.ndarray = None) -> np.ndarray:
+        """
+        get_map_for_render of grids whose first row is row `start` of the map. Ties are broken among the living
+        animals in these rows, or only among those selected by the `animals` mask of the population.
+        """
+        # no animals - plants; animals - the most frequent species, 0 - prey, 1 - predator
+        render = (2 + np.floor(plants)).astype(np.int8)
+        render[prey_count > predator_count] = Species.PREY
+        render[predator_count > prey_count] = Species.PREDATOR
+        tied = (prey_count == predator_count) & (prey_count > 0)
+        if tied.any():
+            # ties go to the first living animal on the tile
+            pop = self.population
+            x = pop.x - start
+            selected = pop.alive & (x >= 0) & (x < len(plants))
+            alive = np.flatnonzero(selected if animals is None else selected & animals)
+            alive = alive[tied[x[alive], pop.y[alive]]]
+            tiles = x[alive].astype(np.int64) * self.config.grid_size + pop.y[alive]
+            order = np.lexsort((pop.arrival[alive], tiles))
+            first = np.r_[True, tiles[order][1:] != tiles[order][:-1]]
+            render.ravel()[tiles[order][first]] = pop.species[alive[order[first]]]
+        return render
+
+    def _init_species(self, n, species):
+        size = self.config.grid_size
+        free_tiles = np.flatnonzero((self._prey_count + self._predator_count).ravel() == 0)
+        if n > len(free_tiles):
+            raise ValueError(f'Cannot place {n} animals on {len(free_tiles)} empty tiles')
+        tiles = self.rng.choice(free_tiles, size=n, replace=False)
+        self.add_animals(tiles // size, tiles % size, self.config.base_animal_energy, species,
+                         default_gene_array(self.config))
+
+    def _count_grid(self, species) -> np.ndarray:
+        return self._prey_count if species == Species.PREY else self._predator_count
+
+    def _update_counts(self, rows: np.ndarray, delta: int):
+        pop = self.population
+        for species in (Species.PREY, Species.PREDATOR):
+            selected = rows[pop.species[rows] == species]
+            np.add.at(self._count_grid(species), self._grid_index(selected), delta)
+
+    def _grid_index(self, rows) -> tuple[np.ndarray, ...]:
+        """
+        Index of the tiles of the animals at `rows` into the grids.
+        """
+        pop = self.population
+        return pop.x[rows], pop.y[rows]
+
+    def _tile_keys(self, rows) -> np.ndarray:
+        """
+        Index of the tiles of the animals at `rows` into the flattened grids.
+        """
+        pop = self.population
+        return pop.x[rows].astype(np.int64) * self.config.grid_size + pop.y[rows]
+
+    def _tile_groups(self):
+        """
+        Order of animals sorted by tile (and by arrival on the tile), with start and end of every tile group.
+        """
+        pop = self.population
+        tiles = self._tile_keys(slice(None))
+        order = np.lexsort((pop.arrival, tiles))
+        sorted_tiles = tiles[order]
+        starts = np.flatnonzero(np.r_[True, sorted_tiles[1:] != sorted_tiles[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        return order, starts, ends, tiles
+
+    def _is_energy_over_max(self, rows) -> np.ndarray:
+        pop = self.population
+        max_energy = np.trunc(pop.genes[rows, Genes.MAX_ANIMAL_ENERGY])
+        return pop.energy[rows] > self.config.max_energy_check_mult * max_energy
+
+    def _aggregate_values(self, rows) -> np.ndarray:
+        pop = self.population
+        return np.column_stack([pop.energy[rows], pop.genes[rows]])
+
+    def _set_energy(self, rows: np.ndarray, energy: np.ndarray):
+        """
+        Change the energy of animals outside of moving, keeping the aggregates of the living ones up to date.
+        """
+        pop = self.population
+        alive = rows[pop.alive[rows]]
+        old_values = self._aggregate_values(alive)
+        pop.energy[rows] = energy
+        self.aggregates.replace(pop.species[alive], old_values, self._aggregate_values(alive))
+
+    def _kill(self, rows: np.ndarray):
+        pop = self.population
+        rows = rows[pop.alive[rows]]
+        pop.alive[rows] = False
+        self._update_counts(rows, -1)
+        self.aggregates.events[Events.DEATHS] += len(rows)
+        self.aggregates.remove(pop.species[rows], self._aggregate_values(rows))
+
+    def _clean_dead_animals(self):
+        # the turn starts here, and so do its event counts
+        self.aggregates.events[:] = 0
+        self.population.compact()
+
+    def _move_animals(self):
+        pop = self.population
+        if not pop.size:
+            return
+        self._move(self._choose_directions())
+
+        # every energy has just changed, the aggregates start over from the animals that survived moving
+        alive = np.flatnonzero(pop.alive)
+        self.aggregates.observe(pop.species[alive], self._aggregate_values(alive))
+
+    def _choose_directions(self) -> np.ndarray:
+        pop = self.population
+        if self.config.simulate_genomes:
+            return choose_directions(x=pop.x, y=pop.y, species=pop.species, genes=pop.genes,
+                                     hungry=~self._is_energy_over_max(slice(None)), prey_count=self._prey_count,
+                                     predator_count=self._predator_count, plants=self.plants, rng=self.rng)
+        return (self.rng.random(pop.size) * N_DIRECTIONS).astype(np.int64)
+
+    def _move(self, directions: np.ndarray):
+        pop = self.population
+        size = self.config.grid_size
+        energy_consumption = pop.genes[:, Genes.VIEWRANGE] * pop.genes[:, Genes.ENERGY_CONSUMPTION_RATIO]
+        energy_int = np.trunc(energy_consumption) \
+            + ((self.rng.random(pop.size) > energy_consumption % 1) & (energy_consumption != 1.))
+        pop.energy[:] = np.maximum(0, pop.energy - energy_int)
+
+        new_x = (pop.x + DIRECTION_OFFSETS[directions, 0]) % size
+        new_y = (pop.y + DIRECTION_OFFSETS[directions, 1]) % size
+        moved = np.flatnonzero((new_x != pop.x) | (new_y != pop.y))
+        self._update_counts(moved, -1)
+        pop.x[moved] = new_x[moved]
+        pop.y[moved] = new_y[moved]
+        self._update_counts(moved, 1)
+        pop.arrival[moved] = np.arange(self.arrival_ID, self.arrival_ID + len(moved))
+        self.arrival_ID += len(moved)
+
+        self._kill(np.flatnonzero(pop.energy <= 0))  # R.I.P.
+
+    def _process_interactions(self):
+        """
+        Animals sharing a tile are paired two by two in the order they entered it; every pair interacts once.
+        """
+        if self.population.size < 2:
+            return
+        order, starts, ends, _ = self._tile_groups()
+        group_sizes = ends - starts
+        rank = np.arange(len(order)) - np.repeat(starts, group_sizes)
+        paired = np.flatnonzero((rank % 2 == 0) & (rank + 1 < np.repeat(group_sizes, group_sizes)))
+        first, second = order[paired], order[paired + 1]
+
+        same_species = self.population.species[first] == self.population.species[second]
+        self._mate(first[same_species], second[same_species])
+        self._hunt(first[~same_species], second[~same_species])
+
+    def _mate(self, first: np.ndarray, second: np.ndarray):
+        pop = self.population
+        config = self.config
+        energy = pop.energy
+        mating = (energy[first] > config.minimal_reproduction_energy) \
+            & (energy[second] > config.minimal_reproduction_energy)
+        first, second = first[mating], second[mating]
+
+        new_first_energy = energy[first] // 3 * 2
+        new_second_energy = energy[second] // 3 * 2
+        child_energy = ((energy[first] - new_first_energy) + (energy[second] - new_second_energy)) \
+            // config.child_energy_den
+        self._set_energy(first, new_first_energy)
+        self._set_energy(second, new_second_energy)
+        self.matings.append((first, second, child_energy))
+
+    def _hunt(self, first: np.ndarray, second: np.ndarray):
+        pop = self.population
+        energy = pop.energy
+        first_is_prey = pop.species[first] == Species.PREY
+        prey = np.where(first_is_prey, first, second)
+        predator = np.where(first_is_prey, second, first)
+
+        hunting = ~self._is_energy_over_max(predator)
+        prey, predator, first = prey[hunting], predator[hunting], first[hunting]
+        self.aggregates.events[Events.PREDATIONS] += len(prey)
+        self._kill(prey)
+        # the energy cap is taken from whichever animal started the interaction
+        gained = np.trunc(energy[prey] * self.config.food_efficiency_ratio)
+        self._set_energy(predator, np.minimum(energy[predator] + gained, pop.genes[first, Genes.MAX_ANIMAL_ENERGY]))
+
+    def _put_newborns_on_map(self):
+        """
+        All children of the turn are born at once, each on its first parent's tile.
+        """
+        if not self.matings:
+            return
+        first, second, child_energy = (np.concatenate(column) for column in zip(*self.matings))
+        pop = self.population
+        genes = combined_gene_arrays(pop.genes[first], pop.genes[second], self.config, self.rng)
+        self.aggregates.events[Events.BIRTHS] += len(first)
+        self._add_newborns(first, child_energy, genes)
+        self.matings.clear()
+
+    def _add_newborns(self, first: np.ndarray, child_energy: np.ndarray, genes: np.ndarray):
+        pop = self.population
+        self.add_animals(pop.x[first], pop.y[first], child_energy, pop.species[first], genes)
+
+    def _process_plants_eating_and_growing(self):
+        pop = self.population
+        rows = np.flatnonzero(pop.alive & (pop.species == Species.PREY))
+        if len(rows):
+            tiles = self._tile_keys(rows)
+            order = np.lexsort((pop.arrival[rows], tiles))
+            rows, tiles = rows[order], tiles[order]
+            boundaries = np.r_[True, tiles[1:] != tiles[:-1]]
+            starts = np.flatnonzero(boundaries)
+            group = np.cumsum(boundaries) - 1
+            group_tiles = tiles[starts]
+
+            is_eater = ~self._is_energy_over_max(rows)
+            eaters_before = np.cumsum(is_eater) - is_eater
+            eater_rank = eaters_before - eaters_before[starts][group]
+            n_eaters = np.bincount(group, weights=is_eater, minlength=len(starts)).astype(np.int64)
+            current_plant_supply = self._plant_supply(group_tiles)
+
+            fed = (current_plant_supply > 1) & (n_eaters > 0)
+            scarce = fed & (current_plant_supply <= n_eaters)
+            plenty = fed & ~scarce
+
+            # scarce plants go one unit each to the first eaters, plenty is shared by all prey on the tile
+            receiving = (scarce[group] & is_eater & (eater_rank < current_plant_supply[group])) | plenty[group]
+            supply = np.where(plenty[group], current_plant_supply[group] / np.maximum(n_eaters, 1)[group], 1.)
+            supply[starts[plenty]] += current_plant_supply[plenty] % n_eaters[plenty]
+
+            rows, supply = rows[receiving], supply[receiving]
+            self._set_energy(rows, np.minimum(pop.energy[rows] + supply, pop.genes[rows, Genes.MAX_ANIMAL_ENERGY]))
+            self._eat_plants(group_tiles[fed])
+
+        self._grow_plants()
+
+    def _set_plants(self, plants: np.ndarray):
+        self.plants[:] = plants
+
+    def _count_grass(self) -> int:
+        """
+        Whole plant units on the map.
+        """
+        return int(np.floor(self.plants).sum(dtype=np.float64))
+
+    def _plant_supply(self, tiles: np.ndarray) -> np.ndarray:
+        """
+        Whole plant units on the tiles given by _tile_keys.
+        """
+        return np.floor(self.plants.ravel()[tiles]).astype(np.int64)
+
+    def _eat_plants(self, tiles: np.ndarray):
+        self.plants.ravel()[tiles] = 0.0
+
+    def _grow_plants(self):
+        np.minimum(self.plants + self.config.plant_regeneration_ratio, self.config.max_plant_supply, out=self.plants)
+        self.aggregates.n_grass = self._count_grass()
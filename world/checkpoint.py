@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import os
+from threading import Thread
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from config import Config
+from world import create_map
+
+if TYPE_CHECKING:
+    from world import Map
+
+# bumped whenever the arrays of a checkpoint change
+FORMAT_VERSION = 2
+
+
+def get_checkpoint_state(world_map: Map, turn: int) -> dict[str, np.ndarray]:
+    """
+    Everything needed to continue the simulation after `turn`: the arrays of Map.get_state (or ArrayMap.get_state),
+    plus the config, the state of the random number generator and the turn. Nothing in it is shared with the map.
+    """
+    state = world_map.get_state()
+    state.update({
+        'format_version': np.array(FORMAT_VERSION),
+        'turn': np.array(turn, dtype=np.int64),
+        # JSON strings, so that the file never has to be unpickled
+        'config': np.array(json.dumps(world_map.config.__dict__)),
+        'rng_state': np.array(json.dumps(world_map.rng.bit_generator.state)),
+    })
+    return state
+
+
+def write_checkpoint(file_name: str, state: dict[str, np.ndarray], compress: bool = True):
+    """
+    Write a state from get_checkpoint_state as a .npz archive of arrays. The file is replaced only once
+    the new one is complete, so an interrupted write leaves the previous checkpoint intact.
+    """
+    temporary_name = f'{file_name}.tmp'
+    with open(temporary_name, 'wb') as file:
+        (np.savez_compressed if compress else np.savez)(file, **state)
+    os.replace(temporary_name, file_name)
+
+
+def save_checkpoint(world_map: Map, file_name: str, turn: int = 0):
+    write_checkpoint(file_name, get_checkpoint_state(world_map, turn))
+
+
+def load_checkpoint(file_name: str) -> tuple[Map, int]:
+    """
+    Recreate the map saved in a checkpoint, with the engine of its config. Returns the map and the turn it was
+    saved after; the map continues exactly as the saved one would have.
+    """
+    with np.load(file_name, allow_pickle=False) as archive:
+        state = {name: archive[name] for name in archive.files}
+    if int(state['format_version']) != FORMAT_VERSION:
+        raise ValueError(f'{file_name} has checkpoint format {int(state["format_version"])}, '
+                         f'expected {FORMAT_VERSION}')
+
+    config = Config()
+    for attr, value in json.loads(str(state['config'])).items():
+        setattr(config, attr, value)
+
+    world_map = create_map(config)
+    world_map.set_state(state)
+    world_map.rng.bit_generator.state = json.loads(str(state['rng_state']))
+    return world_map, int(state['turn'])
+
+
+class CheckpointWriter:
+    """
+    Saves checkpoints of a running simulation to one file without holding it up: the state is copied on the calling
+    thread, and compressing and writing it happen on a background thread while the simulation goes on.
+    At most one checkpoint is being written at a time, a new one waits for the previous write to finish.
+    """
+
+    def __init__(self, file_name: str, compress: bool = True):
+        self.file_name = file_name
+        self.compress = compress
+        self.n_written = 0
+        self._thread: Thread = None
+        self._error: BaseException = None
+
+    def save(self, world_map: Map, turn: int):
+        state = get_checkpoint_state(world_map, turn)
+        self.wait()
+        self._thread = Thread(target=self._write, args=(state,), name='checkpoint-writer')
+        self._thread.start()
+
+    def wait(self):
+        """
+        Block until the last checkpoint is on disk, and raise any error its write ended with.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write(self, state: dict[str, np.ndarray]):
+        try:
+            write_checkpoint(self.file_name, state, compress=self.compress)
+            self.n_written += 1
+        except BaseException as error:
+            self._error = error
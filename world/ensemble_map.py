@@ -0,0 +1,219 @@
+import numpy as np
+
+from config import Config
+from world.aggregates import SPECIES_NAMES
+from world.array_map import ArrayMap
+from world.enumerators import Genes, Species
+from world.genome import default_gene_array
+from world.movement import choose_directions
+from world.neighbourhood import window_index
+from world.population import EnsemblePopulation
+from world.utils import read_only_view
+
+# per-replica values of EnsembleMap.replica_statistics
+REPLICA_FIELDS = ['n_prey', 'n_predators', 'n_grass'] + [
+    f'{species}_{gene.name.lower()}_mean' for species in SPECIES_NAMES for gene in Genes
+]
+
+
+class EnsembleMap(ArrayMap):
+    """
+    `n_replicas` independent simulations of one config stepped in lock-step as a single ArrayMap: the grids have
+    a leading axis of replica slots, every animal carries the slot of its replica, and each phase of the turn runs
+    once for all replicas. Replicas in which prey or predators have died out are retired at the end of the turn
+    and their slots compacted away, see results. All replicas draw from one random number generator seeded with
+    config.seed, so a replica does not follow the course of a single run with that seed.
+    """
+
+    PHASES = ArrayMap.PHASES + ('_retire_extinct_replicas',)
+
+    def __init__(self, config: Config, n_replicas: int, retire_extinct: bool = True):
+        self.n_replicas = n_replicas
+        self.retire_extinct = retire_extinct
+        # replica in every slot, in increasing order
+        self.replicas: np.ndarray = None
+        self.turn = 0
+        # turn each replica was retired after, -1 while it runs
+        self.retired_turn: np.ndarray = None
+        # replica_statistics of every replica as it was retired
+        self.retired_statistics: dict[str, np.ndarray] = None
+        super().__init__(config)
+
+    @property
+    def n_running(self) -> int:
+        return len(self.replicas)
+
+    def init(self):
+        self.replicas = np.arange(self.n_replicas)
+        self.turn = 0
+        self.retired_turn = np.full(self.n_replicas, -1, dtype=np.int64)
+        self.retired_statistics = {
+            field: np.zeros(self.n_replicas, dtype=np.int64 if field.startswith('n_') else np.float64)
+            for field in REPLICA_FIELDS
+        }
+        self._clear(capacity=2 * self.n_replicas * (self.config.n_predator + self.config.n_prey))
+        self.rng = np.random.default_rng(self.config.seed)
+        self._init_species(self.config.n_predator, Species.PREDATOR)
+        self._init_species(self.config.n_prey, Species.PREY)
+        self.aggregates.n_grass = self._count_grass()
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        """
+        ArrayMap.get_state of all running replicas, plus the turn and what is kept of the retired ones.
+        """
+        state = super().get_state()
+        state.update({
+            'replicas': self.replicas.copy(),
+            'ensemble_turn': np.array(self.turn, dtype=np.int64),
+            'retired_turn': self.retired_turn.copy(),
+        })
+        state.update({f'retired_{field}': values.copy() for field, values in self.retired_statistics.items()})
+        return state
+
+    def set_state(self, state: dict[str, np.ndarray]):
+        self.replicas = state['replicas'].copy()
+        self.n_replicas = len(state['retired_turn'])
+        self.turn = int(state['ensemble_turn'])
+        self.retired_turn = state['retired_turn'].copy()
+        self.retired_statistics = {field: state[f'retired_{field}'].copy() for field in REPLICA_FIELDS}
+        super().set_state(state)
+
+    def get_map_for_render(self, slot: int = 0):
+        """
+        ArrayMap.get_map_for_render of the replica in the given slot.
+        """
+        return self._render_grids(self.plants[slot], self._prey_count[slot], self._predator_count[slot],
+                                  animals=self.population.replica == slot)
+
+    def get_neighbourhood(self, x, y, radius: int, slot: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        ArrayMap.get_neighbourhood within the replica in the given slot.
+        """
+        index = (slot,) + window_index(x, y, radius, self.plants.shape[1:])
+        return self._prey_count[index], self._predator_count[index], self.plants[index]
+
+    def replica_statistics(self) -> dict[str, np.ndarray]:
+        """
+        REPLICA_FIELDS of the replica in every slot: populations, grass and mean genes of both species.
+        Means of a species without living animals are NaN.
+        """
+        pop = self.population
+        alive = np.flatnonzero(pop.alive)
+        groups = self._species_groups(alive)
+        counts = self._group_counts(groups)
+        statistics = {
+            'n_prey': counts[:, Species.PREY],
+            'n_predators': counts[:, Species.PREDATOR],
+            'n_grass': np.floor(self.plants).sum(axis=(1, 2), dtype=np.float64).astype(np.int64),
+        }
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for gene in Genes:
+                means = self._group_counts(groups, pop.genes[alive, gene]) / counts
+                for s, species in zip(Species, SPECIES_NAMES):
+                    statistics[f'{species}_{gene.name.lower()}_mean'] = means[:, s]
+        return statistics
+
+    def results(self) -> dict[str, np.ndarray]:
+        """
+        The turn and the replica_statistics of every replica, indexed by replica: as it was retired, or as it is now
+        if it still runs.
+        """
+        results = {'turn': np.where(self.retired_turn >= 0, self.retired_turn, self.turn)}
+        statistics = self.replica_statistics()
+        for field, retired in self.retired_statistics.items():
+            values = retired.astype(statistics[field].dtype)
+            values[self.replicas] = statistics[field]
+            results[field] = values
+        return results
+
+    def next_turn(self):
+        self.turn += 1
+        super().next_turn()
+        if self.profiler is None:
+            self._retire_extinct_replicas()
+
+    def _clear(self, capacity: int):
+        super()._clear(capacity)
+        self.population = EnsemblePopulation(capacity=capacity)
+
+    def _allocate_grids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        shape = (len(self.replicas), self.config.grid_size, self.config.grid_size)
+        return np.ones(shape, dtype=np.float32), np.zeros(shape, dtype=np.int32), np.zeros(shape, dtype=np.int32)
+
+    def _set_grids(self, plants: np.ndarray, prey_count: np.ndarray, predator_count: np.ndarray):
+        self.plants, self._prey_count, self._predator_count = plants, prey_count, predator_count
+        self._prey_count_view = read_only_view(self._prey_count)
+        self._predator_count_view = read_only_view(self._predator_count)
+        self.aggregates.n_grass = self._count_grass()
+
+    def _init_species(self, n, species):
+        size = self.config.grid_size
+        occupied = (self._prey_count + self._predator_count).reshape(len(self.replicas), -1) > 0
+        tiles = []
+        for taken in occupied:
+            free_tiles = np.flatnonzero(~taken)
+            if n > len(free_tiles):
+                raise ValueError(f'Cannot place {n} animals on {len(free_tiles)} empty tiles')
+            tiles.append(self.rng.choice(free_tiles, size=n, replace=False))
+        tiles = np.concatenate(tiles)
+        self.add_animals(tiles // size, tiles % size, self.config.base_animal_energy, species,
+                         default_gene_array(self.config), replica=np.repeat(np.arange(len(self.replicas)), n))
+
+    def _grid_index(self, rows) -> tuple[np.ndarray, ...]:
+        pop = self.population
+        return pop.replica[rows], pop.x[rows], pop.y[rows]
+
+    def _tile_keys(self, rows) -> np.ndarray:
+        pop = self.population
+        size = self.config.grid_size
+        return (pop.replica[rows].astype(np.int64) * size + pop.x[rows]) * size + pop.y[rows]
+
+    def _species_groups(self, rows: np.ndarray) -> np.ndarray:
+        pop = self.population
+        return pop.replica[rows].astype(np.int64) * len(Species) + pop.species[rows]
+
+    def _group_counts(self, groups: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+        """
+        Number (or sum of `weights`) of animals of every slot and species, see _species_groups.
+        """
+        counts = np.bincount(groups, weights=weights, minlength=len(self.replicas) * len(Species))
+        return counts.reshape(len(self.replicas), len(Species))
+
+    def _choose_directions(self) -> np.ndarray:
+        pop = self.population
+        if self.config.simulate_genomes:
+            return choose_directions(x=pop.x, y=pop.y, species=pop.species, genes=pop.genes,
+                                     hungry=~self._is_energy_over_max(slice(None)), prey_count=self._prey_count,
+                                     predator_count=self._predator_count, plants=self.plants, rng=self.rng,
+                                     replica=pop.replica)
+        return super()._choose_directions()
+
+    def _add_newborns(self, first: np.ndarray, child_energy: np.ndarray, genes: np.ndarray):
+        pop = self.population
+        self.add_animals(pop.x[first], pop.y[first], child_energy, pop.species[first], genes,
+                         replica=pop.replica[first])
+
+    def _retire_extinct_replicas(self):
+        if not self.retire_extinct or not len(self.replicas):
+            return
+        pop = self.population
+        counts = self._group_counts(self._species_groups(np.flatnonzero(pop.alive)))
+        extinct = (counts == 0).any(axis=1)
+        if not extinct.any():
+            return
+
+        retired = self.replicas[extinct]
+        self.retired_turn[retired] = self.turn
+        for field, values in self.replica_statistics().items():
+            self.retired_statistics[field][retired] = values[extinct]
+
+        # the animals of the retired replicas leave the aggregates, which cover all running replicas
+        running = ~extinct
+        leaving = ~running[pop.replica]
+        gone = np.flatnonzero(leaving & pop.alive)
+        self.aggregates.remove(pop.species[gone], self._aggregate_values(gone))
+        pop.take(np.flatnonzero(~leaving))
+        pop.replica[:] = (np.cumsum(running) - 1)[pop.replica]
+
+        self.replicas = self.replicas[running]
+        self._set_grids(self.plants[running], self._prey_count[running], self._predator_count[running])
@@ -12,3 +12,17 @@ class Directions(IntEnum):
     LEFT = 2
     RIGHT = 3
     STAY = 4
+
+
+class Genes(IntEnum):
+    VIEWRANGE = 0
+    ENERGY_CONSUMPTION_RATIO = 1
+    MAX_ANIMAL_ENERGY = 2
+    FEAR_OF_PREDATOR_RATIO = 3
+    EATING_OVER_MATING_RATIO = 4
+
+
+class Events(IntEnum):
+    BIRTHS = 0
+    DEATHS = 1
+    PREDATIONS = 2
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from random import uniform
+import numpy as np
 
 from config import Config
 
@@ -13,6 +13,9 @@ GENE_NAMES = [
 ]
 N_GENES = len(GENE_NAMES)
 
+# genes below this index mutate additively, equal or higher multiplicatively
+ADDITIVE_GENES = 3
+
 class Genome:
     """"""
 
@@ -49,32 +52,25 @@ class Genome:
             self.eating_over_mating_ratio
         ]
 
-    @staticmethod
-    def _mutate_gene(gene: float , config: Config, is_additive: bool) -> float:
-        if is_additive:
-            return max(gene + round(uniform(-config.mutation_ratio, config.mutation_ratio), 3), 0.)
-        return gene * (1. + round(uniform(-config.mutation_ratio, config.mutation_ratio), 3))
-    
-    @staticmethod
-    def combined_genome(first: Genome, second: Genome, config: Config) -> Genome:
-        if not config.simulate_genomes:
-            return first
-        first_genes = first.get_genes()
-        second_genes = second.get_genes()
 
-        # below value is ugly cheat: genomes below 3rd index mutate additively, equal or higher multiplicatively
-        arbitral_var= 3
+def default_gene_array(config: Config) -> np.ndarray:
+    """
+    Genes of an initial animal, as a row of a gene array.
+    """
+    return np.array([gene_range[0] for gene_range in config.get_gene_ranges()], dtype=np.float64)
+
 
-        new_genes = []
-        for i in range(len(first_genes)):
-            new_genes.append(Genome._mutate_gene(gene=(first_genes[i] + second_genes[i])/2, config=config, is_additive=i<arbitral_var))
-        
-        gene_ranges = config.get_gene_ranges()
+def combined_gene_arrays(first: np.ndarray, second: np.ndarray, config: Config, rng: np.random.Generator) -> np.ndarray:
+    """
+    Genes of the children of pairs of animals, from their gene rows of shape (n, N_GENES): the mean of both parents,
+    mutated by up to config.mutation_ratio (see ADDITIVE_GENES) and clipped to the gene ranges of the config.
+    """
+    if not config.simulate_genomes:
+        return first.copy()
+    genes = (first + second) / 2
+    mutations = np.round(rng.uniform(-config.mutation_ratio, config.mutation_ratio, size=genes.shape), 3)
+    genes[:, :ADDITIVE_GENES] = np.maximum(genes[:, :ADDITIVE_GENES] + mutations[:, :ADDITIVE_GENES], 0.)
+    genes[:, ADDITIVE_GENES:] *= 1. + mutations[:, ADDITIVE_GENES:]
 
-        return Genome(
-            viewrange=max(gene_ranges[0][1], min(gene_ranges[0][2], new_genes[0])),
-            energy_consumption_ratio=max(gene_ranges[1][1], min(gene_ranges[1][2], new_genes[1])),
-            max_animal_energy=max(gene_ranges[2][1], min(gene_ranges[2][2], new_genes[2])),
-            fear_of_predator_ratio=max(gene_ranges[3][1], min(gene_ranges[3][2], new_genes[3])),
-            eating_over_mating_ratio=max(gene_ranges[4][1], min(gene_ranges[4][2], new_genes[4])),
-        )
+    gene_ranges = np.array(config.get_gene_ranges(), dtype=np.float64)
+    return np.clip(genes, gene_ranges[:, 1], gene_ranges[:, 2])
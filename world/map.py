@@ -1,13 +1,14 @@
-from random import randrange
-from statistics import mode
-
 import numpy as np
 
 from config import Config
+from world.aggregates import Aggregates, COLUMN_NAMES, STATE_ARRAYS
 from world.animals import Animal
-from world.enumerators import Species
-from world.genome import Genome
+from world.enumerators import Events, Species
+from world.genome import Genome, N_GENES, combined_gene_arrays
+from world.neighbourhood import window_index
+from world.profiling import PhaseProfiler
 from world.statistics import Statistics
+from world.utils import read_only_view
 
 
 class MapTile:
@@ -16,38 +17,14 @@ class MapTile:
     """
 
     def __init__(self):
-        self.animals: list[Animal] = []
-        self.plant_supply: float = 1.0
+        # keyed by animal id - dicts keep insertion order, so animals stay in the order they entered the tile
+        self.animals: dict[int, Animal] = {}
 
     def put_animal(self, a: Animal):
-        self.animals.append(a)
+        self.animals[a.id] = a
 
     def remove_animal(self, a_to_remove: Animal):
-        animals = self.animals
-        self.animals = ([a for a in animals if a.id != a_to_remove.id])
-
-    def get_render_value(self) -> int:
-        if self.animals:  # animals - return the most frequent one; 0 - prey, 1 - predator
-            return mode(animal.species for animal in self.animals)
-        else:  # no animals - plants
-            return 2 + self.get_n_plants()
-
-    def is_empty(self) -> int:
-        return len(self.animals) == 0
-
-    def get_n_plants(self) -> int:
-        return int(self.plant_supply)
-    
-    def get_animal_counts(self) -> tuple[int, int]:
-        prey_n: int = 0
-        predator_n: int = 0
-        for animal in self.animals:
-            if animal.species == Species.PREY:
-                prey_n += 1
-            else:
-                predator_n += 1
-        
-        return prey_n, predator_n
+        del self.animals[a_to_remove.id]
 
 
 class Map:
@@ -55,59 +32,189 @@ class Map:
     Class holding all entities on it
     """
 
+    PHASES = ('_clean_dead_animals', '_move_animals', '_process_interactions', '_put_newborns_on_map',
+              '_process_plants_eating_and_growing')
+
     def __init__(self, config: Config):
         self.tiles: list[list[MapTile]] = None
         self.animals: list[Animal] = None
-        self.new_animals: list[Animal] = None
+        self.matings: list[tuple[Animal, Animal, int]] = None
         self.animal_ID: int = None
+        self.rng: np.random.Generator = None
+        self.n_prey: int = None
+        self.n_predator: int = None
+        self.plants: np.ndarray = None
+        self._prey_count: np.ndarray = None
+        self._predator_count: np.ndarray = None
+        self._prey_count_view: np.ndarray = None
+        self._predator_count_view: np.ndarray = None
         self.config = config
+        self.profiler: PhaseProfiler = None
+        self.aggregates = Aggregates(lambda: self.statistics.get_columns())
 
         self.init()
         self.statistics = Statistics(self.config, self)
 
-    def init(self):
-        self.tiles = []
-        self.animals = []
-        self.new_animals = []
-        self.animal_ID = 0
+    @property
+    def prey_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living prey on every tile.
+        """
+        return self._prey_count_view
 
-        self.tiles = [[MapTile() for _ in range(self.config.grid_size)] for _ in range(self.config.grid_size)]
+    @property
+    def predator_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living predators on every tile.
+        """
+        return self._predator_count_view
 
-        Animal.reset_counts()
+    def init(self):
+        self._clear()
+        self.rng = np.random.default_rng(self.config.seed)
         self._init_species(self.config.n_predator, Species.PREDATOR)
         self._init_species(self.config.n_prey, Species.PREY)
+        self.aggregates.n_grass = int(np.floor(self.plants).sum(dtype=np.float64))
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        """
+        Copy of the state of the map between turns as NumPy arrays: plants, id counter, aggregates and one row
+        per animal in the Population columns, in the order of self.animals. `arrival` holds the position of the animal
+        on its tile, so that the order in which animals entered their tiles is kept too.
+        """
+        if self.matings:
+            raise ValueError('The state of the map can only be taken between turns')
+        animals = self.animals
+        n = len(animals)
+        positions = [animal.get_position() for animal in animals]
+        rank = {}
+        for x, y in set(positions):
+            rank.update((animal_id, i) for i, animal_id in enumerate(self.tiles[x][y].animals))
+
+        state = {f'aggregates_{name}': array for name, array in self.aggregates.get_state().items()}
+        state.update({
+            'plants': self.plants.copy(),
+            'animal_ID': np.array(self.animal_ID, dtype=np.int64),
+            'x': np.array([x for x, _ in positions], dtype=np.int32).reshape(n),
+            'y': np.array([y for _, y in positions], dtype=np.int32).reshape(n),
+            'energy': np.fromiter((animal.energy for animal in animals), dtype=np.float64, count=n),
+            'species': np.fromiter((animal.species for animal in animals), dtype=np.int8, count=n),
+            'alive': np.fromiter((not animal.isDead for animal in animals), dtype=np.bool_, count=n),
+            'id': np.fromiter((animal.id for animal in animals), dtype=np.int64, count=n),
+            'arrival': np.fromiter((rank[animal.id] for animal in animals), dtype=np.int64, count=n),
+            'genes': np.array([animal.genome.get_genes() for animal in animals], dtype=np.float64).reshape(n, N_GENES),
+        })
+        return state
+
+    def set_state(self, state: dict[str, np.ndarray]):
+        """
+        Replace the plants, animals and aggregates of the map with a state from get_state. The random number
+        generator is left as it is.
+        """
+        self._clear()
+        self.plants[:] = state['plants']
+        self.animal_ID = int(state['animal_ID'])
+
+        columns = zip(state['x'].tolist(), state['y'].tolist(), state['energy'].tolist(), state['species'].tolist(),
+                      state['alive'].tolist(), state['id'].tolist(), state['genes'].tolist())
+        for x, y, energy, species, alive, animal_id, genes in columns:
+            animal = Animal(x=x, y=y, init_energy=energy, species=Species(species), id=animal_id, map=self,
+                            config=self.config, genome=Genome(*genes))
+            self.animals.append(animal)
+            if alive:
+                self.update_counts(x, y, animal.species, 1)
+            else:
+                animal.isDead = True
+        self.n_prey = int(self._prey_count.sum())
+        self.n_predator = int(self._predator_count.sum())
+
+        # animals enter their tiles in the saved order
+        for row in np.lexsort((state['arrival'], state['y'], state['x'])).tolist():
+            animal = self.animals[row]
+            self.tiles[animal.x][animal.y].put_animal(animal)
+
+        self.aggregates.set_state({name: state[f'aggregates_{name}'] for name in STATE_ARRAYS})
+        self.aggregates.n_grass = int(np.floor(self.plants).sum(dtype=np.float64))
 
     def add_animal(self, x: int, y: int, init_energy: int, species: Species):
         self.animal_ID += 1
         a = Animal(x=x, y=y, init_energy=init_energy, species=species, id=self.animal_ID, map=self, config=self.config)
         self.tiles[x][y].put_animal(a)
         self.animals.append(a)
+        self.update_counts(x, y, species, 1)
+        self.aggregates.add_one(species, a.get_aggregate_values())
 
-    def add_child(self, x: int, y: int, init_energy: int, species: Species, genome: Genome):
-        self.animal_ID += 1
-        self.new_animals.append(
-            Animal(x=x, y=y, init_energy=init_energy, species=species, id=self.animal_ID, map=self, config=self.config, genome=genome))
+    def add_mating(self, first: Animal, second: Animal, child_energy: int):
+        """
+        The child is born on the first parent's tile when newborns are put on the map.
+        """
+        self.matings.append((first, second, child_energy))
+
+    def update_counts(self, x: int, y: int, species: Species, delta: int):
+        if species == Species.PREY:
+            self._prey_count[x, y] += delta
+        else:
+            self._predator_count[x, y] += delta
 
     def get_map_for_render(self):
-        return np.array([[tile.get_render_value() for tile in row] for row in self.tiles], dtype=np.int8)
+        # no animals - plants; animals - the most frequent species, 0 - prey, 1 - predator
+        render = (2 + np.floor(self.plants)).astype(np.int8)
+        render[self._prey_count > self._predator_count] = Species.PREY
+        render[self._predator_count > self._prey_count] = Species.PREDATOR
+        for x, y in np.argwhere((self._prey_count == self._predator_count) & (self._prey_count > 0)):
+            # ties go to the first living animal on the tile
+            render[x, y] = next(animal.species for animal in self.tiles[x][y].animals.values() if not animal.isDead)
+        return render
+
+    def count_animals(self) -> int:
+        return len(self.animals) + len(self.matings)
+
+    def get_neighbourhood(self, x, y, radius: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Prey counts, predator counts and plants within `radius` of (x, y), wrapped around the edges of the map.
+        Coordinate arrays give one window per position, see world.neighbourhood.window_index.
+        """
+        index = window_index(x, y, radius, self.plants.shape)
+        return self._prey_count[index], self._predator_count[index], self.plants[index]
 
     def next_turn(self):
+        if self.profiler is not None:
+            self.profiler.run_turn(self)
+            return
         self._clean_dead_animals()
         self._move_animals()
         self._process_interactions()
         self._put_newborns_on_map()
         self._process_plants_eating_and_growing()
 
+    def _clear(self):
+        size = self.config.grid_size
+        self.tiles = [[MapTile() for _ in range(size)] for _ in range(size)]
+        self.animals = []
+        self.matings = []
+        self.animal_ID = 0
+        self.plants = np.ones((size, size), dtype=np.float32)
+        self._prey_count = np.zeros((size, size), dtype=np.int32)
+        self._predator_count = np.zeros((size, size), dtype=np.int32)
+        self._prey_count_view = read_only_view(self._prey_count)
+        self._predator_count_view = read_only_view(self._predator_count)
+
+        self.n_prey = 0
+        self.n_predator = 0
+        self.aggregates.reset()
+        self.aggregates.events[:] = 0
+
     def _init_species(self, n, species):
         for _ in range(n):
             while True:
-                x = randrange(0, self.config.grid_size)
-                y = randrange(0, self.config.grid_size)
-                if self.tiles[x][y].is_empty():
+                x, y = self.rng.integers(0, self.config.grid_size, size=2).tolist()
+                if self._prey_count[x, y] == 0 and self._predator_count[x, y] == 0:
                     break
             self.add_animal(x, y, self.config.base_animal_energy, species)
 
     def _clean_dead_animals(self):
+        # the turn starts here, and so do its event counts
+        self.aggregates.events[:] = 0
         alive: list[Animal] = []
         dead: list[Animal] = []
         for animal in self.animals:
@@ -119,84 +226,80 @@ class Map:
         self.animals = alive
 
     def _move_animals(self):
-        for a in self.animals:
+        rolls = self.rng.random((len(self.animals), 3)).tolist()
+        survivors_species, survivors_values = [], []
+        for a, (viewrange_roll, direction_roll, energy_roll) in zip(self.animals, rolls):
             old_x, old_y = a.get_position()
-            direction = a.choose_direction()
-            a.move(direction=direction, gridsize=self.config.grid_size)
+            direction = a.choose_direction(viewrange_roll=viewrange_roll, direction_roll=direction_roll)
+            a.move(direction=direction, gridsize=self.config.grid_size, energy_roll=energy_roll)
             new_x, new_y = a.get_position()
             if not (new_x == old_x and new_y == old_y):
                 self.tiles[old_x][old_y].remove_animal(a)
                 self.tiles[new_x][new_y].put_animal(a)
+                # an animal starving on its way has already been taken off the counts at its new tile
+                self.update_counts(old_x, old_y, a.species, -1)
+                self.update_counts(new_x, new_y, a.species, 1)
+            if not a.isDead:
+                survivors_species.append(a.species)
+                survivors_values.append(a.get_aggregate_values())
 
-    def _process_interactions(self):
-        interacted = {}
-        for animal in self.animals:
-            interacted[animal.id] = False
+        # every energy has just changed, the aggregates start over from the animals that survived moving
+        self.aggregates.observe(np.array(survivors_species, dtype=np.int8),
+                                np.array(survivors_values, dtype=np.float64).reshape(-1, len(COLUMN_NAMES)))
 
+    def _process_interactions(self):
+        visited = set()
         for animal in self.animals:
-            if not interacted[animal.id]:
-                x, y = animal.get_position()
-                if len(self.tiles[x][y].animals) > 1:
-                    for i in range(len(self.tiles[x][y].animals) // 2):
-                        self.tiles[x][y].animals[i*2].interact(self.tiles[x][y].animals[i*2 + 1])
-                        interacted[self.tiles[x][y].animals[i*2].id] = True
-                        interacted[self.tiles[x][y].animals[i*2 + 1].id] = True
+            position = animal.get_position()
+            if position not in visited:
+                visited.add(position)
+                x, y = position
+                tile_animals = list(self.tiles[x][y].animals.values())
+                for i in range(len(tile_animals) // 2):
+                    tile_animals[i*2].interact(tile_animals[i*2 + 1])
 
     def _put_newborns_on_map(self):
-        for new_born in self.new_animals:
-            x, y = new_born.get_position()
+        if not self.matings:
+            return
+        firsts, seconds, child_energies = zip(*self.matings)
+        self.aggregates.events[Events.BIRTHS] += len(firsts)
+        child_genes = combined_gene_arrays(first=np.array([a.genome.get_genes() for a in firsts]),
+                                           second=np.array([a.genome.get_genes() for a in seconds]),
+                                           config=self.config, rng=self.rng)
+
+        for parent, child_energy, genes in zip(firsts, child_energies, child_genes.tolist()):
+            x, y = parent.get_position()
+            self.animal_ID += 1
+            new_born = Animal(x=x, y=y, init_energy=child_energy, species=parent.species, id=self.animal_ID, map=self,
+                              config=self.config, genome=Genome(*genes))
             self.animals.append(new_born)
             self.tiles[x][y].put_animal(new_born)
-        self.new_animals.clear()
+            self.update_counts(x, y, new_born.species, 1)
+            self.aggregates.add_one(new_born.species, new_born.get_aggregate_values())
+        self.matings.clear()
 
     def _process_plants_eating_and_growing(self):
-        interacted = {}
-        for animal in self.animals:
-            interacted[animal.id] = False
+        plant_units = np.floor(self.plants)
+        for x, y in np.argwhere((plant_units > 1) & (self._prey_count > 0)):
+            tile = self.tiles[x][y]
+            prey = [a for a in tile.animals.values() if a.species == Species.PREY and not a.isDead]
+            eaters = [a for a in prey if not a.check_if_energy_over_max()]
+            if not eaters:
+                continue
+            current_plant_supply = int(plant_units[x, y])
+
+            if current_plant_supply <= len(eaters):
+                for a in eaters[:current_plant_supply]:
+                    a.set_energy(min(a.energy + 1, a.genome.max_animal_energy))
 
-        for animal in self.animals:
-            if not interacted[animal.id]:
-                x, y = animal.get_position()
-                eaters_ids = []
-                for a in self.tiles[x][y].animals:
-                    interacted[a.id] = True
-                    if a.species == Species.PREY and not a.check_if_energy_over_max():
-                        eaters_ids.append(a.id)
-                current_plant_supply = self.tiles[x][y].plant_supply // 1
-                if current_plant_supply > 1 and len(eaters_ids) > 0:
-
-                    if current_plant_supply <= len(eaters_ids):
-                        supply = 1
-                        i = 0
-                        for a in self.tiles[x][y].animals:
-                            if a.id in eaters_ids:
-                                a.energy = min(a.energy + supply, a.genome.max_animal_energy)
-                                i += 1
-                            if i >= current_plant_supply:
-                                break
-
-                    else:
-                        general_supply = current_plant_supply / len(eaters_ids)
-                        supply = general_supply + current_plant_supply % len(eaters_ids)
-                        for a in self.tiles[x][y].animals:
-                            if a.species == Species.PREY:
-                                a.energy = min(a.energy + supply, a.genome.max_animal_energy)
-                                supply = general_supply
-
-                    self.tiles[x][y].plant_supply = 0.0
-
-        for tiles_row in self.tiles:
-            for tile in tiles_row:
-                tile.plant_supply = min(tile.plant_supply + self.config.plant_regeneration_ratio,
-                                        self.config.max_plant_supply)
-
-    def get_submap(self, x: int, y: int, radius: int) -> list[list[MapTile]]:
-        result_tiles: list[list[MapTile]] = []
-        for i in range(x - radius, x + radius + 1):
-            row: list[MapTile] = []
-            for j in range(y - radius, y + radius + 1):
-                x_size = self.config.grid_size
-                y_size = self.config.grid_size
-                row.append(self.tiles[(i + x_size) % x_size][(j + y_size) % y_size])
-            result_tiles.append(row)
-        return result_tiles
+            else:
+                general_supply = current_plant_supply / len(eaters)
+                supply = general_supply + current_plant_supply % len(eaters)
+                for a in prey:
+                    a.set_energy(min(a.energy + supply, a.genome.max_animal_energy))
+                    supply = general_supply
+
+            self.plants[x, y] = 0.0
+
+        np.minimum(self.plants + self.config.plant_regeneration_ratio, self.config.max_plant_supply, out=self.plants)
+        self.aggregates.n_grass = int(np.floor(self.plants).sum(dtype=np.float64))
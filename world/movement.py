@@ -0,0 +1,204 @@
+from functools import lru_cache
+from typing import Callable
+
+import numpy as np
+
+from world.enumerators import Directions, Genes, Species
+from world.neighbourhood import window_index
+
+N_DIRECTIONS = len(Directions)
+
+# (dx, dy) step of each direction, indexed by Directions value
+DIRECTION_OFFSETS = np.array([[0, -1], [0, 1], [-1, 0], [1, 0], [0, 0]], dtype=np.int32)
+
+# every direction but STAY starts with weight 1, STAY takes the value of the animal's own tile
+DIRECTION_BASE_WEIGHTS = np.array([1., 1., 1., 1., 0.])
+
+# animals whose neighbourhood windows are gathered at once, bounding the memory of choosing directions
+WINDOW_BLOCK = 16384
+
+
+@lru_cache(maxsize=None)
+def direction_kernel(radius: int) -> np.ndarray:
+    """
+    Weights with which every tile of a (2r+1)x(2r+1) neighbourhood contributes to each direction.
+    Returns a read-only array of shape (N_DIRECTIONS, 2r+1, 2r+1), built once per radius and shared afterwards.
+    """
+    n_size = radius * 2 + 1
+    kernel = np.zeros((N_DIRECTIONS, n_size, n_size))
+    kernel[Directions.STAY, radius, radius] = 1.
+    for i in range(n_size):
+        for j in range(n_size):
+            x_dist = abs(i - radius)
+            y_dist = abs(j - radius)
+            if x_dist == 0 and y_dist == 0:
+                continue
+            distance_weight = 1. / (x_dist ** 2 + y_dist ** 2)
+            if i != radius:
+                x_direction = Directions.RIGHT if i > radius else Directions.LEFT
+                kernel[x_direction, i, j] += float(x_dist) / (x_dist + y_dist) * distance_weight
+            if j != radius:
+                y_direction = Directions.DOWN if j > radius else Directions.UP
+                kernel[y_direction, i, j] += float(y_dist) / (x_dist + y_dist) * distance_weight
+    kernel.flags.writeable = False
+    return kernel
+
+
+@lru_cache(maxsize=None)
+def direction_kernel_terms(radius: int) -> tuple[tuple[int, int, tuple[tuple[int, float], ...]], ...]:
+    """
+    direction_kernel for weighting the directions of one animal in plain Python: a (dx, dy, ((direction, weight),
+    ...)) entry for every tile of the neighbourhood, (dx, dy) being its offset from the centre.
+    """
+    kernel = direction_kernel(radius)
+    terms = []
+    for i, j in np.argwhere(kernel.any(axis=0)):
+        weights = tuple((int(d), float(kernel[d, i, j])) for d in np.flatnonzero(kernel[:, i, j]))
+        terms.append((int(i) - radius, int(j) - radius, weights))
+    return tuple(terms)
+
+
+def redistribute_negative_weights(weights: np.ndarray) -> np.ndarray:
+    """
+    Move negative weight of a direction to the opposite one, and negative STAY weight evenly to the other four.
+    Works in place on an array of shape (..., N_DIRECTIONS).
+    """
+    for i in range(4):
+        opposite = i + 1 if i % 2 == 0 else i - 1
+        negative = np.minimum(weights[..., i], 0.)
+        weights[..., opposite] -= negative
+        weights[..., i] -= negative
+    negative = np.minimum(weights[..., Directions.STAY], 0.)
+    weights[..., :Directions.STAY] -= negative[..., np.newaxis] / 4
+    weights[..., Directions.STAY] -= negative
+    return weights
+
+
+def redistribute_negative_weight_list(weights: list[float]) -> list[float]:
+    """
+    redistribute_negative_weights of the N_DIRECTIONS weights of one animal, in place on a list.
+    """
+    for i in range(4):
+        if weights[i] < 0.:
+            opposite = i + 1 if i % 2 == 0 else i - 1
+            weights[opposite] -= weights[i]
+            weights[i] = 0.
+    if weights[Directions.STAY] < 0.:
+        share = weights[Directions.STAY] / 4
+        for i in range(4):
+            weights[i] -= share
+        weights[Directions.STAY] = 0.
+    return weights
+
+
+def sample_direction(weights: list[float], uniform: float) -> int:
+    """
+    sample_directions of one animal, from a list of its weights and one uniform draw from [0, 1).
+    """
+    total = sum(weights)
+    if not total > 0.:
+        weights, total = [1.] * N_DIRECTIONS, float(N_DIRECTIONS)
+    threshold = uniform * total
+    cumulative = 0.
+    direction = 0
+    for weight in weights:
+        cumulative += weight
+        if threshold >= cumulative:
+            direction += 1
+    return min(direction, N_DIRECTIONS - 1)
+
+
+def sample_directions(weights: np.ndarray, uniform: np.ndarray) -> np.ndarray:
+    """
+    Draw one direction per row of `weights` (shape (n, N_DIRECTIONS)) using `uniform` draws from [0, 1).
+    Rows without any positive weight fall back to a uniform choice.
+    """
+    totals = weights.sum(axis=1)
+    degenerate = ~(totals > 0.)
+    if degenerate.any():
+        weights = weights.copy()
+        weights[degenerate] = 1.
+        totals = weights.sum(axis=1)
+    thresholds = np.cumsum(weights, axis=1)
+    directions = (uniform[:, np.newaxis] * totals[:, np.newaxis] >= thresholds).sum(axis=1)
+    return np.minimum(directions, N_DIRECTIONS - 1)
+
+
+def tile_value_coefficients(species: np.ndarray, genes: np.ndarray, hungry: np.ndarray) -> np.ndarray:
+    """
+    Per-animal coefficients of (prey count, predator count, plants) in the value of an occupied tile,
+    see Animal.direction_weights. Returns an array of shape (n, 3).
+    """
+    fear = genes[:, Genes.FEAR_OF_PREDATOR_RATIO]
+    eating_over_mating = genes[:, Genes.EATING_OVER_MATING_RATIO]
+    is_prey = species == Species.PREY
+
+    coefficients = np.empty((len(species), 3))
+    coefficients[:, 0] = np.where(is_prey, 1. / eating_over_mating, eating_over_mating * hungry)
+    coefficients[:, 1] = np.where(is_prey, -fear, 1. / eating_over_mating)
+    coefficients[:, 2] = np.where(is_prey, eating_over_mating * hungry, 0.)
+    return coefficients
+
+
+def choose_directions(x: np.ndarray, y: np.ndarray, species: np.ndarray, genes: np.ndarray, hungry: np.ndarray,
+                      prey_count: np.ndarray, predator_count: np.ndarray, plants: np.ndarray,
+                      rng: np.random.Generator, replica: np.ndarray = None) -> np.ndarray:
+    """
+    Batched Animal.choose_direction: direction weights of all animals are computed in one pass from the per-tile
+    prey, predator and plant grids, then one direction per animal is sampled. With `replica`, the grids have
+    a leading axis of replicas and every animal sees only the grids of its own one.
+    """
+    windows = grid_windows(x, y, prey_count, predator_count, plants, replica)
+    return choose_directions_in_windows(windows, species, genes, hungry, rng)
+
+
+def grid_windows(x: np.ndarray, y: np.ndarray, prey_count: np.ndarray, predator_count: np.ndarray,
+                 plants: np.ndarray, replica: np.ndarray = None) -> Callable[[np.ndarray, int], np.ndarray]:
+    """
+    The `windows` of choose_directions_in_windows for animals at (x, y) on whole grids, see choose_directions.
+    """
+    # only tiles with animals on them are valued, so plants of empty tiles are ignored
+    fields = np.stack([prey_count, predator_count, np.floor(plants) * ((prey_count + predator_count) > 0)], axis=-1)
+
+    def windows(rows: np.ndarray, radius: int) -> np.ndarray:
+        index = window_index(x[rows], y[rows], radius, fields.shape[-3:-1])
+        if replica is not None:
+            index = (replica[rows, np.newaxis, np.newaxis],) + index
+        return fields[index]
+
+    return windows
+
+
+def choose_directions_in_windows(windows: Callable[[np.ndarray, int], np.ndarray], species: np.ndarray,
+                                 genes: np.ndarray, hungry: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    choose_directions for maps without whole grids: `windows(rows, radius)` gives the prey count, predator count
+    and whole plants (0 on empty tiles) within `radius` of the animals at `rows`, as an array of shape
+    (len(rows), 2r+1, 2r+1, 3).
+    """
+    n = len(species)
+
+    viewrange = genes[:, Genes.VIEWRANGE]
+    radii = viewrange.astype(np.int64) + ((rng.random(n) < viewrange % 1) & (viewrange != 1.))
+    weights = direction_weights(windows, radii, tile_value_coefficients(species, genes, hungry))
+
+    redistribute_negative_weights(weights)
+    return sample_directions(weights, rng.random(n))
+
+
+def direction_weights(windows: Callable[[np.ndarray, int], np.ndarray], radii: np.ndarray,
+                      coefficients: np.ndarray) -> np.ndarray:
+    """
+    Weights of shape (n, N_DIRECTIONS), before redistributing negative ones, of animals seeing as far as `radii`
+    and valuing tiles by `coefficients` (see tile_value_coefficients). Windows are asked for at most WINDOW_BLOCK
+    animals at a time.
+    """
+    weights = np.tile(DIRECTION_BASE_WEIGHTS, (len(radii), 1))
+    for radius in np.unique(radii):
+        kernel = direction_kernel(int(radius))
+        same_radius = np.flatnonzero(radii == radius)
+        for start in range(0, len(same_radius), WINDOW_BLOCK):
+            rows = same_radius[start:start + WINDOW_BLOCK]
+            values = np.einsum('nijc,nc->nij', windows(rows, int(radius)), coefficients[rows])
+            weights[rows] += np.einsum('dij,nij->nd', kernel, values)
+    return weights
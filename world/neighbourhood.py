@@ -0,0 +1,26 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def wrapped_indices(size: int, radius: int) -> np.ndarray:
+    """
+    Index table of shape (size, 2r+1): row i holds the indices i-r .. i+r wrapped around a torus of `size` tiles.
+    Built once per (size, radius) and shared as a read-only array.
+    """
+    table = (np.arange(size)[:, np.newaxis] + np.arange(-radius, radius + 1)) % size
+    table.flags.writeable = False
+    return table
+
+
+def window_index(x, y, radius: int, shape: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fancy index selecting the wrapped (2r+1)x(2r+1) neighbourhood of (x, y) from a grid of the given shape.
+    Scalar coordinates select one window of shape (2r+1, 2r+1), coordinate arrays of length n select n windows
+    of shape (n, 2r+1, 2r+1).
+    """
+    rows = wrapped_indices(shape[0], radius)[x]
+    columns = wrapped_indices(shape[1], radius)[y]
+    return rows[..., :, np.newaxis], columns[..., np.newaxis, :]
+
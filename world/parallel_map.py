@@ -0,0 +1,456 @@
+import multiprocessing
+import os
+import weakref
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from config import Config
+from world.aggregates import Aggregates, STATE_ARRAYS
+from world.array_map import ArrayMap
+from world.enumerators import Species
+from world.genome import default_gene_array
+from world.neighbourhood import window_index
+from world.population import Population
+from world.profiling import PhaseProfiler
+from world.statistics import ParallelStatistics
+from world.utils import read_only_view
+
+# grids of the whole map kept in shared memory
+SHARED_GRIDS = {'plants': np.float32, 'prey_count': np.int32, 'predator_count': np.int32, 'render': np.int8}
+
+# every worker numbers its newborns from its own range of ids
+WORKER_ID_STRIDE = 2 ** 40
+
+
+def strip_bounds(grid_size: int, n_workers: int) -> list[tuple[int, int]]:
+    """
+    First and past-the-last row of the strip of the map owned by each worker, strips differ by at most one row.
+    """
+    edges = [grid_size * i // n_workers for i in range(n_workers + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+class SharedGrids:
+    """
+    The SHARED_GRIDS of the whole map in one block of shared memory. Created by the coordinator, which also frees it,
+    and attached by name in the workers.
+    """
+
+    def __init__(self, grid_size: int, name: str = None):
+        sizes = [np.dtype(dtype).itemsize * grid_size ** 2 for dtype in SHARED_GRIDS.values()]
+        self.memory = SharedMemory(name=name, create=name is None, size=sum(sizes))
+        self.grids: dict[str, np.ndarray] = {}
+        offset = 0
+        for (grid, dtype), size in zip(SHARED_GRIDS.items(), sizes):
+            self.grids[grid] = np.ndarray((grid_size, grid_size), dtype=dtype, buffer=self.memory.buf, offset=offset)
+            offset += size
+
+    def free(self):
+        self.grids = {}
+        try:
+            self.memory.close()
+        except BufferError:
+            # views still held elsewhere keep the memory mapped until they go
+            pass
+        self.memory.unlink()
+
+
+class StripMap(ArrayMap):
+    """
+    ArrayMap of one worker of a ParallelMap. It owns the animals and tiles of the rows start..stop of the map, its grids
+    are views of the grids of the whole map in shared memory, and it writes only its own rows of them. The rows
+    of the neighbouring strips within the view range of its animals are read from there while moving, and the animals
+    that leave the strip are handed over to the worker owning their new tile.
+    """
+
+    def __init__(self, config: Config, index: int, bounds: list[tuple[int, int]], grids: dict[str, np.ndarray],
+                 barrier, inboxes: list):
+        self.index = index
+        self.n_workers = len(bounds)
+        self.start, self.stop = bounds[index]
+        self.shared_grids = grids
+        self.barrier = barrier
+        self.inboxes = inboxes
+        super().__init__(config)
+
+    def init(self):
+        # animals are given by the coordinator through set_state, random numbers with every turn
+        self._clear(capacity=Population.INITIAL_CAPACITY)
+        self.rng = np.random.default_rng(self.config.seed)
+
+    def get_map_for_render(self):
+        return self._render_rows(self.start, self.stop)
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        pop = self.population
+        state = {name: getattr(pop, name).copy() for name in Population.COLUMNS}
+        state.update({'animal_ID': self.animal_ID, 'arrival_ID': self.arrival_ID})
+        return state
+
+    def set_state(self, state: dict[str, np.ndarray]):
+        """
+        Take over the animals of the strip and the plants of its rows, as selected by ParallelMap.set_state.
+        """
+        n = len(state['x'])
+        self._clear(capacity=max(2 * n, Population.INITIAL_CAPACITY))
+        self.plants[self.start:self.stop] = state['plants']
+        self.animal_ID = int(state['animal_ID'])
+        self.arrival_ID = int(state['arrival_ID'])
+
+        pop = self.population
+        pop.append(**{name: state[name] for name in Population.COLUMNS if name != 'alive'})
+        pop.alive[:] = state['alive']
+        alive = np.flatnonzero(pop.alive)
+        self._update_counts(alive, 1)
+        self.aggregates.observe(pop.species[alive], self._aggregate_values(alive))
+        self.aggregates.n_grass = int(np.floor(self.plants[self.start:self.stop]).sum(dtype=np.float64))
+
+    def report(self) -> dict:
+        """
+        What the coordinator needs to know about the strip after every turn.
+        """
+        self.aggregates.flush()
+        self.aggregates.refresh_extremes()
+        return {
+            'aggregates': self.aggregates.get_state(),
+            'n_grass': self.aggregates.n_grass,
+            'n_prey': self.population.count(Species.PREY),
+            'n_predators': self.population.count(Species.PREDATOR),
+            'n_animals': self.count_animals(),
+        }
+
+    def _allocate_grids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = slice(self.start, self.stop)
+        self.shared_grids['plants'][rows] = 1.
+        self.shared_grids['prey_count'][rows] = 0
+        self.shared_grids['predator_count'][rows] = 0
+        return self.shared_grids['plants'], self.shared_grids['prey_count'], self.shared_grids['predator_count']
+
+    def _update_counts(self, rows: np.ndarray, delta: int):
+        # animals that have left the strip are counted by their new owner
+        x = self.population.x[rows]
+        super()._update_counts(rows[(x >= self.start) & (x < self.stop)], delta)
+
+    def _move_animals(self):
+        directions = self._choose_directions() if self.population.size else None
+        # no worker changes the grids before all of them have read the grids around their animals
+        self.barrier.wait()
+        if directions is not None:
+            self._move(directions)
+        self._migrate()
+
+        pop = self.population
+        alive = np.flatnonzero(pop.alive)
+        self.aggregates.observe(pop.species[alive], self._aggregate_values(alive))
+
+    def _migrate(self):
+        """
+        Hand the living animals that moved out of the strip over to the neighbouring workers, and take in theirs.
+        Animals move by one tile per turn, so they only ever cross to the next strip up or down. Animals that died on
+        the way are dropped: their deaths are already in the aggregates of this strip.
+        """
+        pop = self.population
+        leaving = (pop.x < self.start) | (pop.x >= self.stop)
+        sent = leaving & pop.alive
+        up = sent & (pop.x == (self.start - 1) % self.config.grid_size)
+        for side, rows, neighbour in ((0, np.flatnonzero(up), self.index - 1),
+                                      (1, np.flatnonzero(sent & ~up), self.index + 1)):
+            columns = {name: getattr(pop, name)[rows] for name in Population.COLUMNS}
+            self.inboxes[neighbour % self.n_workers].put((side, columns))
+        pop.take(np.flatnonzero(~leaving))
+
+        # one message from each side, taken in a fixed order so that a turn does not depend on timing
+        messages = sorted((self.inboxes[self.index].get() for _ in range(2)), key=lambda message: message[0])
+        for _, columns in messages:
+            n = len(columns['x'])
+            if not n:
+                continue
+            start = pop.size
+            arrivals = np.arange(self.arrival_ID, self.arrival_ID + n)
+            self.arrival_ID += n
+            pop.append(**{name: columns[name] for name in Population.COLUMNS if name not in ('alive', 'arrival')},
+                       arrival=arrivals)
+            self._update_counts(np.arange(start, pop.size), 1)
+
+    def _grow_plants(self):
+        plants = self.plants[self.start:self.stop]
+        np.minimum(plants + self.config.plant_regeneration_ratio, self.config.max_plant_supply, out=plants)
+        self.aggregates.n_grass = int(np.floor(plants).sum(dtype=np.float64))
+
+
+def run_worker(index: int, config: Config, bounds: list[tuple[int, int]], memory_name: str, barrier, inboxes: list,
+               connection):
+    """
+    Main loop of a worker process: carry out the commands of the ParallelMap on its StripMap.
+    """
+    shared = SharedGrids(config.grid_size, name=memory_name)
+    strip_map = StripMap(config, index, bounds, shared.grids, barrier, inboxes)
+    start, stop = bounds[index]
+    while True:
+        command, argument = connection.recv()
+        if command == 'stop':
+            break
+        try:
+            if command == 'turn':
+                strip_map.rng = np.random.default_rng(argument)
+                strip_map.next_turn()
+                result = strip_map.report()
+            elif command == 'set_state':
+                strip_map.set_state(argument)
+                result = strip_map.report()
+            elif command == 'get_state':
+                result = strip_map.get_state()
+            elif command == 'columns':
+                result = strip_map.statistics.get_columns()
+            elif command == 'render':
+                shared.grids['render'][start:stop] = strip_map.get_map_for_render()
+                result = None
+            else:
+                raise ValueError(f'{command} is a wrong command')
+        except Exception as error:
+            # the other workers must not wait for this one at the barrier
+            barrier.abort()
+            connection.send(('error', f'{type(error).__name__}: {error}'))
+            break
+        connection.send(('ok', result))
+
+
+def stop_workers(workers: list, shared: SharedGrids):
+    for process, connection in workers:
+        try:
+            connection.send(('stop', None))
+        except (BrokenPipeError, OSError):
+            pass
+    for process, connection in workers:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+        connection.close()
+    shared.free()
+
+
+class ParallelMap:
+    """
+    Map split into strips of rows, each stepped by its own worker process (see StripMap) on its share of the animals.
+    Plants and animal counts of the whole map live in shared memory, from which the workers read the rows around
+    their strips without copying them. Random numbers of every turn come from one seed per worker drawn from
+    the map's generator, so a run depends only on the seed and the number of workers.
+    """
+
+    PHASES = ('_step_workers', '_merge_reports')
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.profiler: PhaseProfiler = None
+        self.rng: np.random.Generator = None
+        self.n_prey: int = None
+        self.n_predator: int = None
+        self.plants: np.ndarray = None
+        self._prey_count: np.ndarray = None
+        self._predator_count: np.ndarray = None
+        self._prey_count_view: np.ndarray = None
+        self._predator_count_view: np.ndarray = None
+        self.aggregates = Aggregates(lambda: self.statistics.get_columns())
+        self.bounds: list[tuple[int, int]] = None
+        self._workers: list = []
+        self._shared: SharedGrids = None
+        # kept alive for as long as the workers, which attach to them
+        self._barrier = None
+        self._inboxes: list = []
+        self._stopper: weakref.finalize = None
+        self._reports: list[dict] = []
+        self._n_animals = 0
+
+        self.init()
+        self.statistics = ParallelStatistics(self.config, self)
+
+    @property
+    def prey_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living prey on every tile.
+        """
+        return self._prey_count_view
+
+    @property
+    def predator_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living predators on every tile.
+        """
+        return self._predator_count_view
+
+    def init(self):
+        # the config may have changed since the last init, workers start over with it
+        self._start_workers()
+        self.rng = np.random.default_rng(self.config.seed)
+
+        size = self.config.grid_size
+        n_predator, n_prey = self.config.n_predator, self.config.n_prey
+        n = n_predator + n_prey
+        if n > size * size:
+            raise ValueError(f'Cannot place {n} animals on {size * size} empty tiles')
+        tiles = self.rng.choice(size * size, size=n, replace=False)
+        self.set_state({
+            'x': (tiles // size).astype(np.int32),
+            'y': (tiles % size).astype(np.int32),
+            'energy': np.full(n, self.config.base_animal_energy, dtype=np.float64),
+            'species': np.repeat(np.array([Species.PREDATOR, Species.PREY], dtype=np.int8), [n_predator, n_prey]),
+            'alive': np.ones(n, dtype=np.bool_),
+            'id': np.arange(1, n + 1, dtype=np.int64),
+            'arrival': np.arange(n, dtype=np.int64),
+            'genes': np.tile(default_gene_array(self.config), (n, 1)),
+            'plants': np.ones((size, size), dtype=np.float32),
+            'animal_ID': np.array(n, dtype=np.int64),
+            'arrival_ID': np.array(n, dtype=np.int64),
+        })
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared memory; also done when the map is garbage collected or
+        the interpreter exits.
+        """
+        self.plants = self._prey_count = self._predator_count = None
+        self._prey_count_view = self._predator_count_view = None
+        if self._stopper is not None:
+            self._stopper()
+        self._workers = []
+        self._shared = None
+        self._barrier = None
+        self._inboxes = []
+        self._stopper = None
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        """
+        State of the whole map in the format of ArrayMap.get_state, plus the id counters of every worker.
+        """
+        states = self._command('get_state')
+        state = {f'aggregates_{name}': array for name, array in self.aggregates.get_state().items()}
+        state.update({name: np.concatenate([strip[name] for strip in states]) for name in Population.COLUMNS})
+        state.update({
+            'plants': self.plants.copy(),
+            'animal_ID': np.array(max(strip['animal_ID'] for strip in states), dtype=np.int64),
+            'arrival_ID': np.array(max(strip['arrival_ID'] for strip in states), dtype=np.int64),
+            'worker_animal_ID': np.array([strip['animal_ID'] for strip in states], dtype=np.int64),
+            'worker_arrival_ID': np.array([strip['arrival_ID'] for strip in states], dtype=np.int64),
+        })
+        return state
+
+    def set_state(self, state: dict[str, np.ndarray]):
+        """
+        Hand every worker the animals and plants of its strip from a state of the whole map (also one of
+        ArrayMap.get_state). The random number generator is left as it is.
+        """
+        stops = np.array([stop for _, stop in self.bounds])
+        owner = np.searchsorted(stops, state['x'], side='right')
+        n_workers = len(self.bounds)
+        if len(state.get('worker_animal_ID', ())) == n_workers:
+            animal_IDs, arrival_IDs = state['worker_animal_ID'], state['worker_arrival_ID']
+        else:
+            animal_IDs = int(state['animal_ID']) + WORKER_ID_STRIDE * np.arange(n_workers)
+            arrival_IDs = np.full(n_workers, int(state['arrival_ID']))
+
+        strips = []
+        for index, (start, stop) in enumerate(self.bounds):
+            rows = np.flatnonzero(owner == index)
+            strip = {name: state[name][rows] for name in Population.COLUMNS}
+            strip.update({'plants': state['plants'][start:stop], 'animal_ID': animal_IDs[index],
+                          'arrival_ID': arrival_IDs[index]})
+            strips.append(strip)
+        self._reports = self._command('set_state', strips)
+        self._merge_reports()
+        if 'aggregates_count' in state:
+            self.aggregates.set_state({name: state[f'aggregates_{name}'] for name in STATE_ARRAYS})
+
+    def get_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Species, energies and genes of all living animals, gathered from the workers in strip order.
+        """
+        species, energy, genes = zip(*self._command('columns'))
+        return np.concatenate(species), np.concatenate(energy), np.concatenate(genes)
+
+    def get_map_for_render(self):
+        # every worker renders its own rows into the shared render grid
+        self._command('render')
+        return self._shared.grids['render'].copy()
+
+    def count_animals(self) -> int:
+        return self._n_animals
+
+    def get_neighbourhood(self, x, y, radius: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Prey counts, predator counts and plants within `radius` of (x, y), wrapped around the edges of the map.
+        Coordinate arrays give one window per position, see world.neighbourhood.window_index.
+        """
+        index = window_index(x, y, radius, self.plants.shape)
+        return self._prey_count[index], self._predator_count[index], self.plants[index]
+
+    def next_turn(self):
+        if self.profiler is not None:
+            self.profiler.run_turn(self)
+            return
+        self._step_workers()
+        self._merge_reports()
+
+    def _step_workers(self):
+        seeds = self.rng.integers(2 ** 63, size=len(self._workers)).tolist()
+        self._reports = self._command('turn', seeds)
+
+    def _merge_reports(self):
+        self.aggregates.reset()
+        self.aggregates.events[:] = 0
+        for report in self._reports:
+            self.aggregates.merge(report['aggregates'])
+        self.aggregates.n_grass = sum(report['n_grass'] for report in self._reports)
+        self.n_prey = sum(report['n_prey'] for report in self._reports)
+        self.n_predator = sum(report['n_predators'] for report in self._reports)
+        self._n_animals = sum(report['n_animals'] for report in self._reports)
+
+    def _command(self, command: str, arguments: list = None) -> list:
+        """
+        Send a command to every worker (with its own argument, if given) and return their results in worker order.
+        """
+        connections = [connection for _, connection in self._workers]
+        for i, connection in enumerate(connections):
+            connection.send((command, arguments[i] if arguments is not None else None))
+
+        results = [None] * len(connections)
+        pending = dict(zip(connections, range(len(connections))))
+        while pending:
+            for connection in wait(list(pending)):
+                index = pending.pop(connection)
+                try:
+                    status, results[index] = connection.recv()
+                except (EOFError, OSError):
+                    status, results[index] = 'error', 'the process died'
+                if status == 'error':
+                    self.close()
+                    raise RuntimeError(f'Worker {index} failed on {command}: {results[index]}')
+        return results
+
+    def _start_workers(self):
+        self.close()
+        size = self.config.grid_size
+        n_workers = min(self.config.n_workers or os.cpu_count() or 1, size)
+        self.bounds = strip_bounds(size, n_workers)
+
+        # spawned rather than forked, the GUI runs the simulation from a thread
+        context = multiprocessing.get_context('spawn')
+        self._shared = SharedGrids(size)
+        self._barrier = context.Barrier(n_workers)
+        self._inboxes = [context.Queue() for _ in range(n_workers)]
+        for index in range(n_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=run_worker, name=f'strip-{index}', daemon=True,
+                                      args=(index, self.config, self.bounds, self._shared.memory.name, self._barrier,
+                                            self._inboxes, worker_connection))
+            process.start()
+            worker_connection.close()
+            self._workers.append((process, connection))
+        self._stopper = weakref.finalize(self, stop_workers, self._workers, self._shared)
+
+        grids = self._shared.grids
+        self.plants = grids['plants']
+        self._prey_count, self._predator_count = grids['prey_count'], grids['predator_count']
+        self._prey_count_view = read_only_view(self._prey_count)
+        self._predator_count_view = read_only_view(self._predator_count)
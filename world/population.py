@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import numpy as np
+
+from world.genome import N_GENES
+
+
+class Population:
+    """
+    Struct-of-arrays storage of animals - every attribute lives in its own preallocated, growable NumPy column
+    """
+
+    INITIAL_CAPACITY = 1024
+    GROWTH_FACTOR = 2
+
+    COLUMNS = {
+        'x': (np.int32, ()),
+        'y': (np.int32, ()),
+        'energy': (np.float64, ()),
+        'species': (np.int8, ()),
+        'alive': (np.bool_, ()),
+        'id': (np.int64, ()),
+        'arrival': (np.int64, ()),  # order in which animals entered their current tile
+        'genes': (np.float64, (N_GENES,)),
+    }
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.size = 0
+        self.capacity = max(int(capacity), 1)
+        self._columns: dict[str, np.ndarray] = {
+            name: np.zeros((self.capacity,) + shape, dtype=dtype) for name, (dtype, shape) in self.COLUMNS.items()
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._columns['x'][:self.size]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._columns['y'][:self.size]
+
+    @property
+    def energy(self) -> np.ndarray:
+        return self._columns['energy'][:self.size]
+
+    @property
+    def species(self) -> np.ndarray:
+        return self._columns['species'][:self.size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._columns['alive'][:self.size]
+
+    @property
+    def id(self) -> np.ndarray:
+        return self._columns['id'][:self.size]
+
+    @property
+    def arrival(self) -> np.ndarray:
+        return self._columns['arrival'][:self.size]
+
+    @property
+    def genes(self) -> np.ndarray:
+        return self._columns['genes'][:self.size]
+
+    def append(self, x, y, energy, species, id, arrival, genes):
+        """
+        Append a batch of animals; scalar arguments are broadcast over the batch.
+        """
+        x = np.atleast_1d(x)
+        n = len(x)
+        if n == 0:
+            return
+        self.reserve(self.size + n)
+        new = slice(self.size, self.size + n)
+        self._columns['x'][new] = x
+        self._columns['y'][new] = y
+        self._columns['energy'][new] = energy
+        self._columns['species'][new] = species
+        self._columns['alive'][new] = True
+        self._columns['id'][new] = id
+        self._columns['arrival'][new] = arrival
+        self._columns['genes'][new] = genes
+        self.size += n
+
+    def reserve(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= Population.GROWTH_FACTOR
+        for name, column in self._columns.items():
+            grown = np.zeros((new_capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self._columns[name] = grown
+        self.capacity = new_capacity
+
+    def compact(self):
+        """
+        Drop dead animals, keeping the order of the living ones.
+        """
+        self.take(np.flatnonzero(self.alive))
+
+    def take(self, indices: np.ndarray):
+        """
+        Keep only the rows at `indices`, in the given order.
+        """
+        n = len(indices)
+        for column in self._columns.values():
+            column[:n] = column[indices]
+        self.size = n
+
+    def count(self, species) -> int:
+        return int(np.count_nonzero(self.alive & (self.species == species)))
+
+
+class EnsemblePopulation(Population):
+    """
+    Population of the animals of many replicas of a simulation, each animal knows the slot of the replica it lives in
+    """
+
+    COLUMNS = {**Population.COLUMNS, 'replica': (np.int32, ())}
+
+    @property
+    def replica(self) -> np.ndarray:
+        return self._columns['replica'][:self.size]
+
+    def append(self, replica, **columns):
+        start = self.size
+        super().append(**columns)
+        self._columns['replica'][start:self.size] = replica
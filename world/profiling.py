@@ -0,0 +1,104 @@
+import json
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+
+class PhaseStats:
+    """
+    Running aggregates of one phase of the turn, over all turns and over the last `window` turns
+    """
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total_seconds = 0.
+        self.min_seconds = float('inf')
+        self.max_seconds = 0.
+        self.total_animals = 0
+        self.total_allocations = 0
+        self.max_traced_bytes = 0
+        self.recent_seconds = deque(maxlen=window)
+
+    def add(self, record: dict):
+        self.count += 1
+        self.total_seconds += record['seconds']
+        self.min_seconds = min(self.min_seconds, record['seconds'])
+        self.max_seconds = max(self.max_seconds, record['seconds'])
+        self.total_animals += record['animals']
+        self.total_allocations += record['allocations']
+        self.max_traced_bytes = max(self.max_traced_bytes, record.get('traced_bytes', 0))
+        self.recent_seconds.append(record['seconds'])
+
+    def as_dict(self) -> dict:
+        return {
+            'turns': self.count,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.count if self.count else 0.,
+            'min_seconds': self.min_seconds if self.count else 0.,
+            'max_seconds': self.max_seconds,
+            'recent_mean_seconds': sum(self.recent_seconds) / len(self.recent_seconds) if self.recent_seconds else 0.,
+            'mean_animals': self.total_animals / self.count if self.count else 0.,
+            'mean_allocations': self.total_allocations / self.count if self.count else 0.,
+            'max_traced_bytes': self.max_traced_bytes,
+        }
+
+
+class PhaseProfiler:
+    """
+    Opt-in instrumentation of Map.next_turn. Assign an instance to `world_map.profiler` to record, for every phase
+    of every turn, its wall time, the number of animals it worked on and the net number of memory blocks it allocated
+    (plus the peak of traced memory with `trace_memory`, which slows the simulation down noticeably).
+    """
+
+    def __init__(self, window: int = 100, trace_memory: bool = False):
+        self.window = window
+        self.trace_memory = trace_memory
+        self.n_turns = 0
+        self.stats: dict[str, PhaseStats] = {}
+        self.recent_turns: deque[dict] = deque(maxlen=window)
+
+    def run_turn(self, world_map):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        turn = {}
+        for phase in world_map.PHASES:
+            animals_before = world_map.count_animals()
+            blocks_before = sys.getallocatedblocks()
+            if self.trace_memory:
+                tracemalloc.reset_peak()
+                traced_before = tracemalloc.get_traced_memory()[0]
+
+            start = time.perf_counter()
+            getattr(world_map, phase)()
+            seconds = time.perf_counter() - start
+
+            record = {
+                'seconds': seconds,
+                'animals': max(animals_before, world_map.count_animals()),
+                'allocations': sys.getallocatedblocks() - blocks_before,
+            }
+            if self.trace_memory:
+                record['traced_bytes'] = tracemalloc.get_traced_memory()[1] - traced_before
+
+            name = phase.lstrip('_')
+            turn[name] = record
+            self.stats.setdefault(name, PhaseStats(self.window)).add(record)
+
+        self.n_turns += 1
+        self.recent_turns.append(turn)
+
+    def last_turn(self) -> dict:
+        return self.recent_turns[-1] if self.recent_turns else {}
+
+    def summary(self) -> dict:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def total_seconds(self) -> float:
+        return sum(stats.total_seconds for stats in self.stats.values())
+
+    def dump(self, file_name: str):
+        with open(file_name, 'w') as file:
+            json.dump({'turns': self.n_turns, 'phases': self.summary(), 'recent_turns': list(self.recent_turns)},
+                      file, indent=2)
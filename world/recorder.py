@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from config import Config
+from world.aggregates import COLUMN_NAMES, EVENT_NAMES, SPECIES_NAMES
+
+if TYPE_CHECKING:
+    from world import Map
+
+TURN_RECORD_DTYPE = np.dtype(
+    [('turn', np.int64), ('n_prey', np.int64), ('n_predators', np.int64), ('n_grass', np.int64)]
+    + [(event, np.int64) for event in EVENT_NAMES]
+    + [(f'{species}_{column}_mean', np.float64) for species in SPECIES_NAMES for column in COLUMN_NAMES]
+)
+
+MAGIC = b'PPTURNS1'
+# magic, then the length of the JSON header describing the fields, then the records
+HEADER_PREFIX = struct.Struct(f'<{len(MAGIC)}sI')
+
+FRAMES_MAGIC = b'PPFRAME1'
+# magic, number of frames written so far, length of the JSON header, then the preallocated frames
+FRAMES_HEADER_PREFIX = struct.Struct(f'<{len(FRAMES_MAGIC)}sQI')
+# frames start at a multiple of this offset
+FRAMES_ALIGNMENT = 64
+
+# optional grids of a frame besides the render grid
+FRAME_GRIDS = {'prey_count': np.int32, 'predator_count': np.int32, 'plants': np.float32}
+
+
+class TurnRecorder:
+    """
+    Streams one fixed-width binary record per turn (TURN_RECORD_DTYPE) to an append-only file, see read_turn_records.
+    Records are collected in a preallocated buffer and written `buffer_size` at a time. `resume_after` keeps
+    the records of an existing file up to that turn, so that a run resumed from a checkpoint continues it.
+    """
+
+    def __init__(self, file_name: str, buffer_size: int = 1024, resume_after: int = None):
+        self.file_name = file_name
+        self.buffer = np.zeros(buffer_size, dtype=TURN_RECORD_DTYPE)
+        self.n_buffered = 0
+
+        if resume_after is not None and os.path.exists(file_name):
+            records = read_turn_records(file_name)
+            n_kept = int(np.searchsorted(records['turn'], resume_after, side='right'))
+            offset = read_header(file_name)[1]
+            del records
+            self.file = open(file_name, 'r+b')
+            self.file.truncate(offset + n_kept * TURN_RECORD_DTYPE.itemsize)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(file_name, 'wb')
+            header = json.dumps({'fields': [[name, TURN_RECORD_DTYPE[name].str] for name in TURN_RECORD_DTYPE.names]})
+            self.file.write(HEADER_PREFIX.pack(MAGIC, len(header)) + header.encode())
+
+    def record(self, turn: int, world_map: Map):
+        statistics = world_map.statistics
+        aggregates = world_map.aggregates
+        aggregates.flush()
+        means = np.where(aggregates.count[:, np.newaxis] > 0, aggregates.mean, np.nan)
+
+        self.buffer[self.n_buffered] = (turn, statistics.get_n_prey(), statistics.get_n_predators(),
+                                        aggregates.n_grass, *aggregates.events.tolist(), *means.ravel().tolist())
+        self.n_buffered += 1
+        if self.n_buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.n_buffered].tobytes())
+        self.file.flush()
+        self.n_buffered = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self) -> TurnRecorder:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_header(file_name: str) -> tuple[np.dtype, int]:
+    """
+    Record dtype of a file written by TurnRecorder and the offset of its first record.
+    """
+    with open(file_name, 'rb') as file:
+        magic, length = HEADER_PREFIX.unpack(file.read(HEADER_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f'{file_name} is not a turn record file')
+        header = json.loads(file.read(length))
+    dtype = np.dtype([(name, type_string) for name, type_string in header['fields']])
+    return dtype, HEADER_PREFIX.size + length
+
+
+def read_turn_records(file_name: str) -> np.ndarray:
+    """
+    Read-only structured array of all complete records in a file written by TurnRecorder, memory-mapped rather than
+    loaded, so e.g. `read_turn_records(file_name)['n_prey']` reads only what it uses. A record cut off by
+    an interrupted write is left out.
+    """
+    dtype, offset = read_header(file_name)
+    n_records = (os.path.getsize(file_name) - offset) // dtype.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(n_records,))
+
+
+def frame_dtype(grid_size: int, grids: bool = False) -> np.dtype:
+    shape = (grid_size, grid_size)
+    fields = [('turn', np.int64), ('render', np.int8, shape)]
+    if grids:
+        fields += [(name, dtype, shape) for name, dtype in FRAME_GRIDS.items()]
+    return np.dtype(fields)
+
+
+class FrameRecorder:
+    """
+    Writes the get_map_for_render grid of every `every`-th turn, and with `grids` also the prey, predator and plant
+    grids (of slot 0 for an EnsembleMap), into a memory-mapped file, see read_frames. Room for `capacity` frames is allocated up front and doubled
+    whenever it runs out; the number of frames in the header is updated after each one, so a run that is killed
+    leaves a readable file. `resume_after` keeps the frames of an existing file up to that turn.
+    """
+
+    def __init__(self, file_name: str, config: Config, every: int = 1, grids: bool = False, capacity: int = 1024,
+                 resume_after: int = None):
+        self.file_name = file_name
+        self.every = every
+        self.dtype = frame_dtype(config.grid_size, grids)
+        self.grids = grids
+
+        if resume_after is not None and os.path.exists(file_name):
+            dtype, self.offset, _, _ = read_frames_header(file_name)
+            if dtype != self.dtype:
+                raise ValueError(f'{file_name} holds frames of a different kind')
+            frames, _ = read_frames(file_name)
+            self.n_frames = int(np.searchsorted(frames['turn'], resume_after, side='right'))
+            del frames
+            self.file = open(file_name, 'r+b')
+        else:
+            header = json.dumps({
+                'fields': [[name, self.dtype[name].base.str, list(self.dtype[name].shape)] for name in self.dtype.names],
+                'every': every,
+                'config': config.__dict__,
+            })
+            header += ' ' * (-(FRAMES_HEADER_PREFIX.size + len(header)) % FRAMES_ALIGNMENT)
+            self.n_frames = 0
+            self.offset = FRAMES_HEADER_PREFIX.size + len(header)
+            self.file = open(file_name, 'w+b')
+            self.file.write(FRAMES_HEADER_PREFIX.pack(FRAMES_MAGIC, 0, len(header)) + header.encode())
+            self.file.flush()
+        self._write_n_frames()
+        self.frames = self._map(max(capacity, self.n_frames))
+
+    def record(self, turn: int, world_map: Map):
+        if turn % self.every:
+            return
+        if self.n_frames == len(self.frames):
+            self.frames.flush()
+            self.frames = self._map(2 * len(self.frames))
+
+        i = self.n_frames
+        self.frames['turn'][i] = turn
+        self.frames['render'][i] = world_map.get_map_for_render()
+        if self.grids:
+            for name in FRAME_GRIDS:
+                grid = getattr(world_map, name)
+                # the grids of an EnsembleMap have a leading axis of replica slots, the rendered one is recorded
+                self.frames[name][i] = grid[0] if grid.ndim == 3 else grid
+        self.n_frames += 1
+        self._write_n_frames()
+
+    def flush(self):
+        self.frames.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.frames.flush()
+        self.frames = None
+        # the unused preallocated frames are given back
+        self.file.truncate(self.offset + self.n_frames * self.dtype.itemsize)
+        self.file.close()
+
+    def __enter__(self) -> FrameRecorder:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, capacity: int) -> np.memmap:
+        # mapping beyond the end of the file grows it
+        return np.memmap(self.file_name, dtype=self.dtype, mode='r+', offset=self.offset, shape=(capacity,))
+
+    def _write_n_frames(self):
+        os.pwrite(self.file.fileno(), struct.pack('<Q', self.n_frames), len(FRAMES_MAGIC))
+
+
+def read_frames_header(file_name: str) -> tuple[np.dtype, int, int, dict]:
+    """
+    Frame dtype of a file written by FrameRecorder, the offset of its first frame, the number of frames and the rest
+    of the header.
+    """
+    with open(file_name, 'rb') as file:
+        magic, n_frames, length = FRAMES_HEADER_PREFIX.unpack(file.read(FRAMES_HEADER_PREFIX.size))
+        if magic != FRAMES_MAGIC:
+            raise ValueError(f'{file_name} is not a frame file')
+        header = json.loads(file.read(length))
+    dtype = np.dtype([(name, type_string, tuple(shape)) for name, type_string, shape in header['fields']])
+    return dtype, FRAMES_HEADER_PREFIX.size + length, n_frames, header
+
+
+def read_frames(file_name: str) -> tuple[np.ndarray, Config]:
+    """
+    Frames written by FrameRecorder as a read-only memory-mapped structured array with `turn` and `render` fields
+    (and the FRAME_GRIDS if they were recorded), and the config of the recorded run. Frames are only read from disk
+    when they are accessed.
+    """
+    dtype, offset, n_frames, header = read_frames_header(file_name)
+    config = Config()
+    for attr, value in header['config'].items():
+        setattr(config, attr, value)
+
+    if n_frames == 0:
+        return np.zeros(0, dtype=dtype), config
+    return np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(n_frames,)), config
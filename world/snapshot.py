@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from world.utils import read_only_view
+
+if TYPE_CHECKING:
+    from world import Map
+
+
+class Snapshot:
+    """
+    Copy of everything the GUI draws after a turn. It shares no memory with the map, so it can be handed over
+    to another thread while the simulation goes on.
+    """
+
+    def __init__(self, turn: int, world_map: Map, genes: bool = False):
+        statistics = world_map.statistics
+
+        self.turn = turn
+        self.render = read_only_view(world_map.get_map_for_render())
+        # one point of the population graph
+        self.counts = (turn, statistics.get_n_prey(), statistics.get_n_predators(), statistics.get_n_grass())
+        # running aggregates of the turn, see world.aggregates.Aggregates.record
+        self.record = statistics.get_record()
+
+        species, energy, gene_columns = statistics.get_columns()
+        self.species = read_only_view(species)
+        self.energy = read_only_view(energy)
+        # gene columns are only kept on request, the GUI needs them only while their histograms are shown
+        self.genes = read_only_view(gene_columns) if genes else None
+
+    def has_genes(self) -> bool:
+        return self.genes is not None
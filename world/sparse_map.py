@@ -0,0 +1,250 @@
+import numpy as np
+
+from config import Config
+from world.array_map import ArrayMap
+from world.enumerators import Species
+from world.genome import default_gene_array
+from world.movement import choose_directions_in_windows
+from world.neighbourhood import window_index
+from world.population import Population
+from world.utils import read_only_view
+
+# plants are stored in whole units of the first of these types they fit in, see plant_units
+PLANT_UNIT_DTYPES = (np.uint16, np.uint32)
+# most decimals of the plant parameters that can be stored exactly
+MAX_PLANT_DECIMALS = 6
+
+
+def plant_units(config: Config) -> tuple[int, type]:
+    """
+    Number of stored units per plant and their type: the smallest power of ten in which the regeneration ratio and
+    the maximum plant supply are whole numbers, so that plants grow exactly, and the first of PLANT_UNIT_DTYPES that
+    holds the maximum plus one regrowth.
+    """
+    values = (config.plant_regeneration_ratio, config.max_plant_supply)
+    for decimals in range(MAX_PLANT_DECIMALS + 1):
+        scale = 10 ** decimals
+        if all(abs(value * scale - round(value * scale)) <= 1e-9 * max(1., abs(value * scale)) for value in values):
+            break
+    else:
+        raise ValueError(f'The sparse engine stores plants with at most {MAX_PLANT_DECIMALS} decimals, '
+                         f'plant_regeneration_ratio and max_plant_supply have more')
+
+    top = round((config.max_plant_supply + config.plant_regeneration_ratio) * scale)
+    for dtype in PLANT_UNIT_DTYPES:
+        if top <= np.iinfo(dtype).max:
+            return scale, dtype
+    raise ValueError(f'The sparse engine cannot store {config.max_plant_supply} plants '
+                     f'in steps of {config.plant_regeneration_ratio}')
+
+
+class SparseMap(ArrayMap):
+    """
+    ArrayMap for huge, mostly empty maps. Plants are a dense grid of fixed-point units (see plant_units), the prey
+    and predator counts are kept only for the chunks of CHUNK_SIZE x CHUNK_SIZE tiles that animals are in: a chunk
+    table maps every chunk of the map to its counts in a pool, a chunk is taken from the pool when the first animal
+    enters it and given back once it is empty. Nothing of the size of the map is allocated but the plants.
+    """
+
+    CHUNK_SIZE = 32
+    INITIAL_CHUNKS = 64
+
+    def __init__(self, config: Config):
+        self.plant_scale, self.plant_dtype = plant_units(config)
+        self.plant_units: np.ndarray = None
+        # index of the counts of every chunk in the pool, -1 if it has none
+        self._chunk_table: np.ndarray = None
+        # prey and predator counts of the taken chunks, of shape (capacity, 2, CHUNK_SIZE, CHUNK_SIZE)
+        self._chunks: np.ndarray = None
+        self._free_chunks: list[int] = None
+        self._n_chunks = 0
+        super().__init__(config)
+
+    @property
+    def plants(self) -> np.ndarray:
+        """
+        Plant supply of every tile, computed from plant_units into a new read-only float32 grid on every access:
+        writing to it would change nothing, so it cannot be written to.
+        """
+        if self.plant_units is None:
+            return None
+        return read_only_view((self.plant_units / np.float32(self.plant_scale)).astype(np.float32))
+
+    @plants.setter
+    def plants(self, plants: np.ndarray):
+        # a grid of plant supplies is stored in plant units
+        if plants is None:
+            self.plant_units = None
+        else:
+            self.plant_units = np.round(np.asarray(plants) * self.plant_scale).astype(self.plant_dtype)
+
+    @property
+    def prey_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living prey on every tile, built on every access.
+        """
+        return self._dense_counts(Species.PREY)
+
+    @property
+    def predator_count(self) -> np.ndarray:
+        """
+        Read-only grid with the number of living predators on every tile, built on every access.
+        """
+        return self._dense_counts(Species.PREDATOR)
+
+    @property
+    def n_chunks(self) -> int:
+        """
+        Number of chunks with counts.
+        """
+        return self._n_chunks - len(self._free_chunks)
+
+    def init(self):
+        self._clear(capacity=2 * (self.config.n_predator + self.config.n_prey))
+        self.rng = np.random.default_rng(self.config.seed)
+        # predators first, then prey, on tiles drawn without replacement, without looking at the empty ones
+        n_predator, n_prey = self.config.n_predator, self.config.n_prey
+        size = self.config.grid_size
+        if n_predator + n_prey > size ** 2:
+            raise ValueError(f'Cannot place {n_predator + n_prey} animals on {size ** 2} empty tiles')
+        tiles = self.rng.choice(size ** 2, size=n_predator + n_prey, replace=False)
+        species = np.repeat(np.array([Species.PREDATOR, Species.PREY], dtype=np.int8), [n_predator, n_prey])
+        self.add_animals(tiles // size, tiles % size, self.config.base_animal_energy, species,
+                         default_gene_array(self.config))
+        self.aggregates.n_grass = self._count_grass()
+
+    def get_map_for_render(self):
+        render = (2 + self.plant_units // self.plant_scale).astype(np.int8)
+        pop = self.population
+        alive = np.flatnonzero(pop.alive)
+        if not len(alive):
+            return render
+        # the most frequent species of every tile with animals, ties go to the first living animal on it
+        tiles = self._tile_keys(alive)
+        order = np.lexsort((pop.arrival[alive], tiles))
+        first = alive[order[np.r_[True, tiles[order][1:] != tiles[order][:-1]]]]
+        counts = self._counts_at(pop.x[first], pop.y[first])
+        prey_count, predator_count = counts[:, Species.PREY], counts[:, Species.PREDATOR]
+        render.ravel()[self._tile_keys(first)] = np.where(
+            prey_count > predator_count, Species.PREY,
+            np.where(predator_count > prey_count, Species.PREDATOR, pop.species[first]))
+        return render
+
+    def get_neighbourhood(self, x, y, radius: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        size = self.config.grid_size
+        x, y = np.broadcast_arrays(*window_index(x, y, radius, (size, size)))
+        counts = self._counts_at(x, y)
+        plants = self.plant_units[x, y] / np.float32(self.plant_scale)
+        return counts[..., Species.PREY], counts[..., Species.PREDATOR], plants.astype(np.float32)
+
+    def _clear(self, capacity: int):
+        size = self.config.grid_size
+        n_chunks = -(-size // self.CHUNK_SIZE)
+        self.population = Population(capacity=capacity)
+        self.plant_units = np.full((size, size), self.plant_scale, dtype=self.plant_dtype)
+        self._chunk_table = np.full((n_chunks, n_chunks), -1, dtype=np.int32)
+        self._chunks = np.zeros((self.INITIAL_CHUNKS, len(Species), self.CHUNK_SIZE, self.CHUNK_SIZE), dtype=np.int32)
+        self._free_chunks = []
+        self._n_chunks = 0
+        self.matings = []
+        self.animal_ID = 0
+        self.arrival_ID = 0
+        self.aggregates.reset()
+        self.aggregates.events[:] = 0
+
+    def _set_plants(self, plants: np.ndarray):
+        self.plants = plants
+
+    def _count_grass(self) -> int:
+        return int((self.plant_units // self.plant_scale).sum(dtype=np.int64))
+
+    def _dense_counts(self, species: Species) -> np.ndarray:
+        size = self.config.grid_size
+        pop = self.population
+        grid = np.zeros((size, size), dtype=np.int32)
+        selected = pop.alive & (pop.species == species)
+        np.add.at(grid, (pop.x[selected], pop.y[selected]), 1)
+        return read_only_view(grid)
+
+    def _counts_at(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Prey and predator counts of the tiles (x, y), as an array of their shape with a trailing axis of species.
+        """
+        ids = self._chunk_table[x // self.CHUNK_SIZE, y // self.CHUNK_SIZE]
+        counts = self._chunks[np.maximum(ids, 0), :, x % self.CHUNK_SIZE, y % self.CHUNK_SIZE]
+        counts[ids < 0] = 0
+        return counts
+
+    def _chunk_ids(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Pool index of the counts of the chunks of the tiles (x, y), taking chunks for the ones without any.
+        """
+        chunk_x, chunk_y = x // self.CHUNK_SIZE, y // self.CHUNK_SIZE
+        ids = self._chunk_table[chunk_x, chunk_y]
+        missing = ids < 0
+        if missing.any():
+            chunks = np.unique(chunk_x[missing].astype(np.int64) * len(self._chunk_table) + chunk_y[missing])
+            self._chunk_table.ravel()[chunks] = self._take_chunks(len(chunks))
+            ids = self._chunk_table[chunk_x, chunk_y]
+        return ids
+
+    def _take_chunks(self, n: int) -> np.ndarray:
+        reused = [self._free_chunks.pop() for _ in range(min(n, len(self._free_chunks)))]
+        new = np.arange(self._n_chunks, self._n_chunks + n - len(reused))
+        self._n_chunks += len(new)
+        if self._n_chunks > len(self._chunks):
+            capacity = len(self._chunks)
+            while capacity < self._n_chunks:
+                capacity *= Population.GROWTH_FACTOR
+            grown = np.zeros((capacity,) + self._chunks.shape[1:], dtype=self._chunks.dtype)
+            grown[:len(self._chunks)] = self._chunks
+            self._chunks = grown
+        return np.concatenate([np.array(reused, dtype=np.int64), new])
+
+    def _free_empty_chunks(self):
+        chunks = np.flatnonzero(self._chunk_table.ravel() >= 0)
+        ids = self._chunk_table.ravel()[chunks]
+        empty = ~self._chunks[ids].any(axis=(1, 2, 3))
+        self._chunk_table.ravel()[chunks[empty]] = -1
+        self._free_chunks.extend(ids[empty].tolist())
+
+    def _update_counts(self, rows: np.ndarray, delta: int):
+        pop = self.population
+        x, y = pop.x[rows], pop.y[rows]
+        # taking chunks may grow the pool
+        ids = self._chunk_ids(x, y)
+        np.add.at(self._chunks, (ids, pop.species[rows], x % self.CHUNK_SIZE, y % self.CHUNK_SIZE), delta)
+
+    def _clean_dead_animals(self):
+        super()._clean_dead_animals()
+        self._free_empty_chunks()
+
+    def _choose_directions(self) -> np.ndarray:
+        pop = self.population
+        if not self.config.simulate_genomes:
+            return super()._choose_directions()
+        size = self.config.grid_size
+
+        def windows(rows: np.ndarray, radius: int) -> np.ndarray:
+            x, y = np.broadcast_arrays(*window_index(pop.x[rows], pop.y[rows], radius, (size, size)))
+            counts = self._counts_at(x, y)
+            # only tiles with animals on them are valued, so plants of empty tiles are ignored
+            plants = (self.plant_units[x, y] // self.plant_scale) * counts.any(axis=-1)
+            return np.concatenate([counts, plants[..., np.newaxis]], axis=-1).astype(np.float64)
+
+        return choose_directions_in_windows(windows, pop.species, pop.genes, ~self._is_energy_over_max(slice(None)),
+                                            self.rng)
+
+    def _plant_supply(self, tiles: np.ndarray) -> np.ndarray:
+        return (self.plant_units.ravel()[tiles] // self.plant_scale).astype(np.int64)
+
+    def _eat_plants(self, tiles: np.ndarray):
+        self.plant_units.ravel()[tiles] = 0
+
+    def _grow_plants(self):
+        step = self.plant_dtype(round(self.config.plant_regeneration_ratio * self.plant_scale))
+        max_units = self.plant_dtype(round(self.config.max_plant_supply * self.plant_scale))
+        # in place, plant_units leaves room for one step above the maximum
+        np.add(self.plant_units, step, out=self.plant_units)
+        np.minimum(self.plant_units, max_units, out=self.plant_units)
+        self.aggregates.n_grass = self._count_grass()
@@ -5,12 +5,13 @@ from typing import TYPE_CHECKING
 import numpy as np
 
 from config import Config
-from world.animals import Animal
 from world.enumerators import Species
 from world.genome import N_GENES
 
 if TYPE_CHECKING:
     from map import Map
+    from world.array_map import ArrayMap
+    from world.parallel_map import ParallelMap
 
 
 class Statistics:
@@ -22,42 +23,74 @@ class Statistics:
         self.config = config
         self.world_map = world_map
 
-    @staticmethod
-    def get_n_prey():
-        return Animal.n_prey
+    def get_n_prey(self):
+        return self.world_map.n_prey
 
-    @staticmethod
-    def get_n_predators():
-        return Animal.n_predator
+    def get_n_predators(self):
+        return self.world_map.n_predator
 
     def get_n_grass(self):
-        return sum(tile.get_n_plants() for row in self.world_map.tiles for tile in row)
+        return self.world_map.aggregates.n_grass
+
+    def get_record(self) -> dict:
+        """
+        Running aggregates of the current turn, see world.aggregates.Aggregates.record.
+        """
+        return self.world_map.aggregates.record()
+
+    def get_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Species, energies and genes (shape (n, N_GENES)) of all living animals, gathered in one pass.
+        """
+        animals = [animal for animal in self.world_map.animals if not animal.isDead]
+        species = np.fromiter((animal.species for animal in animals), dtype=np.int8, count=len(animals))
+        energy = np.fromiter((animal.energy for animal in animals), dtype=np.float64, count=len(animals))
+        genes = np.array([animal.genome.get_genes() for animal in animals], dtype=np.float64).reshape(-1, N_GENES)
+        return species, energy, genes
+
+
+class ArrayStatistics(Statistics):
+    """
+    Class responsible for calculating statistics of a map storing its animals in a Population
+    """
+
+    def __init__(self, config: Config, world_map: ArrayMap):
+        super().__init__(config, world_map)
 
-    def get_gene_arrays(self):
-        prey_genes = [[] for _ in range(N_GENES)]
-        predator_genes = [[] for _ in range(N_GENES)]
+    def get_n_prey(self):
+        return self.world_map.population.count(Species.PREY)
 
-        for animal in self.world_map.animals:
-            if animal.species == Species.PREY:
-                current_genes = prey_genes
-            else:
-                current_genes = predator_genes
+    def get_n_predators(self):
+        return self.world_map.population.count(Species.PREDATOR)
 
-            animal_genes = animal.genome.get_genes()
-            for i in range(N_GENES):
-                current_genes[i].append(animal_genes[i])
+    def get_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        population = self.world_map.population
+        alive = population.alive
+        return population.species[alive], population.energy[alive], population.genes[alive]
 
-        prey_genes = [np.array(genes) for genes in prey_genes]
-        predator_genes = [np.array(genes) for genes in predator_genes]
 
-        return prey_genes, predator_genes
+class ParallelStatistics(Statistics):
+    """
+    Class responsible for calculating statistics of a map whose animals are spread over worker processes
+    """
 
-    def get_energies(self):
-        prey_energies, predator_energies = [], []
-        for animal in self.world_map.animals:
-            if animal.species == Species.PREY:
-                prey_energies.append(animal.energy)
-            else:
-                predator_energies.append(animal.energy)
+    def __init__(self, config: Config, world_map: ParallelMap):
+        super().__init__(config, world_map)
 
-        return prey_energies, predator_energies
+    def get_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.world_map.get_columns()
+
+
+def species_histograms(species: np.ndarray, values: np.ndarray, bin_range: tuple[float, float],
+                       n_bins: int) -> np.ndarray:
+    """
+    Counts of `values` in `n_bins` equal-width bins over `bin_range`, separately for every species: an array of shape
+    (len(Species), n_bins). Values outside of the range are counted in the outermost bins.
+    """
+    low, high = bin_range
+    if high <= low:
+        low, high = low - 0.5, high + 0.5
+    bins = np.floor((values - low) * (n_bins / (high - low)))
+    bins = np.clip(bins, 0, n_bins - 1).astype(np.int64)
+    counts = np.bincount(species.astype(np.int64) * n_bins + bins, minlength=len(Species) * n_bins)
+    return counts.reshape(len(Species), n_bins)
@@ -0,0 +1,10 @@
+import numpy as np
+
+
+def read_only_view(array: np.ndarray) -> np.ndarray:
+    """
+    View of the array that cannot be written through.
+    """
+    view = array.view()
+    view.flags.writeable = False
+    return view